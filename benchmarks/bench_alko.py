@@ -0,0 +1,248 @@
+"""
+Alko price list ingest benchmark, run against a synthetic price list in the layout of the real one.
+
+Writes a sample xlsx (title rows, the real column headings, shared strings and numeric cells) and reports:
+parse -- stream-parsing the xlsx into products
+ingest -- first ingest into the columnar PriceList and the SQLite PriceStore
+re-ingest -- ingesting a new list where only --changed products differ, most rows are skipped
+top-N -- top-N queries by euros per gram of alcohol, with and without type and name filters
+and checks the parsed products match the sample rows heading by heading, with the right euros per gram, that
+the re-ingest picks up exactly the --changed products, and that the top-N lists come out sorted.
+
+Usage:
+python bench_alko.py --products 10000 --changed 50
+python bench_alko.py --write alko_sample.xlsx --products 200   (just writes a sample file to try in the app)
+"""
+
+from xml.sax.saxutils import escape
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from alko import readProducts, PriceList, PriceStore, HEADINGS as FIELDS, ETHANOL_DENSITY  # noqa: E402
+
+HEADINGS = ("Numero", "Nimi", "Valmistaja", "Pullokoko", "Hinta", "Litrahinta", "Uutuus", "Hinnastojärjestyskoodi",
+            "Tyyppi", "Alatyyppi", "Erityisryhmä", "Oluttyyppi", "Valmistusmaa", "Alue", "Vuosikerta",
+            "Etikettimerkintöjä", "Huomautus", "Rypäleet", "Luonnehdinta", "Pakkaustyyppi", "Suljentatyyppi",
+            "Alkoholi-%", "Hapot g/l", "Sokeri g/l", "Kantavierrep-%", "Väri EBC", "Katkerot EBU",
+            "Energia kcal/100 ml", "Valikoima", "EAN")
+TYPES = (("punaviinit", 12.5, 0.75), ("valkoviinit", 12.0, 0.75), ("oluet", 4.7, 0.33), ("siiderit", 4.5, 0.33),
+         ("viskit", 40.0, 0.7), ("vodkat ja viinat", 38.0, 0.5), ("liköörit ja katkerot", 21.0, 0.5),
+         ("alkoholittomat", 0.0, 0.75))
+COUNTRIES = ("Suomi", "Ranska", "Italia", "Espanja", "Saksa", "Skotlanti", "Chile")
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+
+
+def sampleProducts(count, seed=0, changed=0):
+    """
+    Rows of a synthetic price list, changed rows get a new price
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        kind, abv, size = rng.choice(TYPES)
+        price = round(rng.uniform(2, 60) * (1.1 if i < changed else 1.0), 2)
+        yield {"Numero": "%06d" % (100000 + i),
+               "Nimi": "Tuote %d %s" % (i, kind.split()[0]),
+               "Valmistaja": "Valmistaja %d" % rng.randrange(500),
+               "Pullokoko": ("%.2f l" % size).replace(".", ","),
+               "Hinta": price,
+               "Litrahinta": round(price / size, 2),
+               "Tyyppi": kind,
+               "Valmistusmaa": rng.choice(COUNTRIES),
+               "Alkoholi-%": abv + rng.choice((-0.5, 0.0, 0.5)) if abv else 0.0,
+               "EAN": "64%011d" % i,
+               }
+
+
+def writeSample(path, products):
+    """
+    Writes products as an xlsx price list, text in shared strings and numbers in numeric cells
+    """
+    strings = {}
+
+    def cell(ref, value):
+        if isinstance(value, (int, float)):
+            return '<c r="%s"><v>%s</v></c>' % (ref, value)
+        index = strings.setdefault(value, len(strings))
+        return '<c r="%s" t="s"><v>%d</v></c>' % (ref, index)
+
+    def column(index):
+        name = ""
+        index += 1
+        while index:
+            index, rest = divmod(index - 1, 26)
+            name = chr(65 + rest) + name
+        return name
+
+    rows = [["Alkon hinnasto 01.01.2024"], ["Hinnat ovat voimassa toistaiseksi."], [], list(HEADINGS)]
+    rows.extend([product.get(heading) for heading in HEADINGS] for product in products)
+    sheet = []
+    for number, values in enumerate(rows, 1):
+        cells = "".join(cell(column(index) + str(number), value) for index, value in enumerate(values)
+                        if value is not None)
+        sheet.append('<row r="%d">%s</row>' % (number, cells))
+
+    shared = "".join("<si><t>%s</t></si>" % escape(text) for text in strings)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+                         '<?xml version="1.0" encoding="UTF-8"?>'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Default Extension="xml" ContentType="application/xml"/>'
+                         '<Override PartName="/xl/workbook.xml" ContentType="application/'
+                         'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/></Types>')
+        archive.writestr("xl/workbook.xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="%s" xmlns:r="http://schemas.'
+                         'openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+                         '<sheet name="Alkon Hinnasto" sheetId="1" r:id="rId1"/></sheets></workbook>' % _MAIN_NS)
+        archive.writestr("xl/_rels/workbook.xml.rels",
+                         '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.'
+                         'openxmlformats.org/package/2006/relationships"><Relationship Id="rId1" Type="http://'
+                         'schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                         'Target="worksheets/sheet1.xml"/></Relationships>')
+        archive.writestr("xl/sharedStrings.xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><sst xmlns="%s" count="%d" uniqueCount="%d">%s</sst>'
+                         % (_MAIN_NS, len(strings), len(strings), shared))
+        archive.writestr("xl/worksheets/sheet1.xml",
+                         '<?xml version="1.0" encoding="UTF-8"?><worksheet xmlns="%s"><sheetData>%s</sheetData>'
+                         '</worksheet>' % (_MAIN_NS, "".join(sheet)))
+
+
+def same(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9)
+    return a == b
+
+
+def checkProducts(products, rows):
+    """
+    Compares parsed products to the sample rows they came from, returns a list of mismatches
+    """
+    problems = []
+    if len(products) != len(rows):
+        problems.append("%d products parsed from %d rows" % (len(products), len(rows)))
+    for product, row in zip(products, rows):
+        size = float(row["Pullokoko"].split()[0].replace(",", "."))
+        expected = {field: row.get(heading) for heading, field in FIELDS.items()}
+        expected.update(size=size, price=float(row["Hinta"]), litre_price=float(row["Litrahinta"]),
+                        abv=float(row["Alkoholi-%"]))
+        # Grams of alcohol in the bottle: litres * 1000 ml * abv * density
+        grams = size * 1000 * expected["abv"] / 100 * ETHANOL_DENSITY
+        expected["eur_per_gram"] = expected["price"] / grams if grams else None
+        for field, value in expected.items():
+            if not same(product.get(field), value):
+                problems.append("%s %s: %r, expected %r" % (row["Numero"], field, product.get(field), value))
+    return problems
+
+
+def changedNumbers(before, after):
+    """
+    Numbers of the products that differ between two lists of products
+    """
+    old = {product["number"]: product for product in before}
+    return {product["number"] for product in after
+            if any(not same(value, old[product["number"]].get(field)) for field, value in product.items())}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Alko price list ingest and queries.")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--changed", type=int, default=50, help="products with a new price in the second list")
+    parser.add_argument("--queries", type=int, default=100, help="top-N queries to average over")
+    parser.add_argument("--write", metavar="FILE", help="only write a sample price list to FILE")
+    args = parser.parse_args(argv)
+
+    if args.write:
+        writeSample(args.write, sampleProducts(args.products))
+        print("Wrote %d products to %s" % (args.products, args.write))
+        return 0
+
+    folder = tempfile.mkdtemp()
+    try:
+        problems = runChecked(args, folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    for problem in problems[:20]:
+        print("  " + problem)
+    print("all products and changes check out" if not problems else "%d PROBLEMS" % len(problems))
+    return 0 if not problems else 1
+
+
+def runChecked(args, folder):
+    """
+    Writes the sample lists to folder and runs the timings, returns the problems the checks found
+    """
+    first = os.path.join(folder, "first.xlsx")
+    second = os.path.join(folder, "second.xlsx")
+    writeSample(first, sampleProducts(args.products))
+    writeSample(second, sampleProducts(args.products, changed=args.changed))
+
+    problems = []
+    products, parse_ms = timed(lambda: list(readProducts(first)))
+    problems += checkProducts(products, list(sampleProducts(args.products)))
+    prices = PriceList()
+    store = PriceStore(os.path.join(folder, "alko.sqlite"))
+    counts, ingest_ms = timed(prices.ingest, products)
+    store_counts, store_ms = timed(store.ingest, products)
+    print("parse      %8.1f ms  %d products, %.0f kB file" % (parse_ms, len(products), os.path.getsize(first) / 1024))
+    print("ingest     %8.1f ms  added %d, changed %d, removed %d (store %.1f ms)"
+          % ((ingest_ms,) + counts + (store_ms,)))
+    for name, got in (("list", counts), ("store", store_counts)):
+        if got != (args.products, 0, 0):
+            problems.append("first ingest into the %s: added, changed, removed %r" % (name, got))
+
+    before = list(prices.products())
+    changed = list(readProducts(second))
+    problems += checkProducts(changed, list(sampleProducts(args.products, changed=args.changed)))
+    counts, ingest_ms = timed(prices.ingest, changed)
+    store_counts, store_ms = timed(store.ingest, changed)
+    print("re-ingest  %8.1f ms  added %d, changed %d, removed %d (store %.1f ms)"
+          % ((ingest_ms,) + counts + (store_ms,)))
+    # Only the first --changed rows got a new price
+    expected = {product["number"] for product in products[:args.changed]}
+    for name, got, after in (("list", counts, prices.products()), ("store", store_counts, store.products())):
+        if got != (0, len(expected), 0):
+            problems.append("re-ingest into the %s: added, changed, removed %r" % (name, got))
+        rewritten = changedNumbers(before, list(after))
+        if rewritten != expected:
+            problems.append("re-ingest into the %s changed %d products, %d of them unexpected, %d missed"
+                            % (name, len(rewritten), len(rewritten - expected), len(expected - rewritten)))
+
+    _, index_ms = timed(prices.order, "eur_per_gram")
+    print("index      %8.1f ms  sorting by eur_per_gram after the changes" % index_ms)
+    for label, kwargs in (("top-50", {}),
+                          ("top-50 type", {"type": "oluet"}),
+                          ("top-50 name", {"query": "tuote 99"}),
+                          ("top-50 price", {"by": "price", "reverse": True})):
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            found = prices.top(50, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000 / args.queries
+        print("%-10s %8.3f ms  %d found, first %s %.4f €/g" % (label, elapsed, len(found),
+                                                               found[0]["name"] if found else "-",
+                                                               (found[0]["eur_per_gram"] or 0) if found else 0))
+        values = [product[kwargs.get("by", "eur_per_gram")] for product in found]
+        # Products without a value come last
+        present = [value for value in values if value is not None]
+        if values[:len(present)] != sorted(present, reverse=kwargs.get("reverse", False)):
+            problems.append(label + " isn't sorted")
+    store.close()
+    return problems
+
+
+if __name__ == "__main__":
+    sys.exit(main())
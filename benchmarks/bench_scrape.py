@@ -0,0 +1,189 @@
+"""
+End-to-end throughput benchmark for the Duunitori scraper, run against the local mock server.
+
+Every combination of the given worker counts, parsers and parse processes scrapes the same synthetic search,
+without the response cache or the seen store, and reports:
+pages/s -- listing and detail pages handled per second of wall time
+p50/p99 -- request latency in milliseconds, as seen by the fetcher
+peak MB -- peak Python heap during the run (tracemalloc, which slows the run down a bit, --no-memory skips it)
+parse CPU s -- CPU time spent in the parsing functions, not counting the parse pool's worker processes
+
+Usage:
+python bench_scrape.py --pages 20 --workers 1,4,8 --parsers html.parser,lxml --latency 0.05 --error-rate 0.01
+python bench_scrape.py --profiles 4 --parse-processes 0,2,4 --parsers html.parser --latency 0
+"""
+
+from threading import Lock
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mock_server import MockDuunitori  # noqa: E402
+from duunitori import Scraper, Job  # noqa: E402
+from fetcher import Fetcher  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from session import HttpSession  # noqa: E402
+import parsing  # noqa: E402
+
+# selectolax parser class, if it's installed, so it can be switched back on after trying the other parsers
+SELECTOLAX = parsing.HTMLParser
+
+PROFILE = {"keywords": ["python"], "locations": ["Helsinki"], "searchDesc": False, "name": "bench"}
+
+
+class TimedFetcher(Fetcher):
+    """
+    Fetcher recording the latency of every request
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.__lock = Lock()
+
+    def get(self, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().get(url, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.__lock:
+                self.latencies.append(elapsed)
+
+
+class ParseTimer:
+    """
+    Wraps the parsing functions to sum up the CPU time spent in them, in whichever thread they run
+    """
+
+    NAMES = ("parseListing", "parseJob")
+
+    def __init__(self):
+        self.cpu = 0.0
+        self.__lock = Lock()
+        self.__originals = {}
+
+    def __enter__(self):
+        for name in self.NAMES:
+            self.__originals[name] = getattr(parsing, name)
+            setattr(parsing, name, self.__wrap(self.__originals[name]))
+        return self
+
+    def __exit__(self, *exc):
+        for name, function in self.__originals.items():
+            setattr(parsing, name, function)
+
+    def __wrap(self, function):
+        def timed(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.thread_time() - start
+                with self.__lock:
+                    self.cpu += elapsed
+        return timed
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
+
+
+def setParser(name):
+    """
+    Picks the parsing backend: selectolax, lxml or html.parser
+    """
+    if name == "selectolax":
+        if SELECTOLAX is None:
+            raise SystemExit("selectolax is not installed")
+        parsing.HTMLParser = SELECTOLAX
+        return
+    if name == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            raise SystemExit("lxml is not installed")
+    # BeautifulSoup backends, selectolax has to be switched off to use them
+    parsing.HTMLParser = None
+    parsing.PARSER = name
+
+
+def run(server, workers, memory=True, profiles=1, parse_processes=0):
+    session = HttpSession(pool_size=workers, backoff=0)
+    fetcher = TimedFetcher(workers=workers, rate=0, session=session)
+    parse_pool = parsing.ParsePool(parse_processes) if parse_processes else None
+    scraper = Scraper(fetcher, settings={"base_url": server.url, "cache": None, "seen": None, "dedupe": False},
+                      parse_pool=parse_pool)
+    # Profiles searching for different keywords, so they don't share any jobs
+    searches = [dict(PROFILE, keywords=["python%d" % i], name="bench%d" % i) for i in range(profiles)]
+    jobs = 0
+
+    if memory:
+        tracemalloc.start()
+    with ParseTimer() as timer:
+        start = time.perf_counter()
+        for event in Scheduler(scraper, parallel=profiles).events(searches):
+            if isinstance(event, Job):
+                jobs += 1
+        elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if memory else 0
+    if memory:
+        tracemalloc.stop()
+    scraper.close()
+    session.close()
+
+    requests = len(fetcher.latencies)
+    return {"workers": workers,
+            "parse_processes": parse_processes,
+            "jobs": jobs,
+            "requests": requests,
+            "seconds": elapsed,
+            "pages_per_second": requests / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(fetcher.latencies, 0.50) * 1000,
+            "p99_ms": percentile(fetcher.latencies, 0.99) * 1000,
+            "peak_mb": peak / 1024 / 1024,
+            "parse_cpu_seconds": timer.cpu,
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Duunitori scraper against a local mock server.")
+    parser.add_argument("--pages", type=int, default=10, help="listing pages in the search")
+    parser.add_argument("--jobs-per-page", type=int, default=20)
+    parser.add_argument("--workers", default="1,4,8,16", help="comma separated worker counts to compare")
+    parser.add_argument("--parsers", default="selectolax" if SELECTOLAX is not None else parsing.PARSER,
+                        help="comma separated: selectolax, lxml, html.parser")
+    parser.add_argument("--latency", type=float, default=0.02, help="server side delay per response in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay per response in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses failing with 503")
+    parser.add_argument("--no-memory", action="store_true", help="don't trace memory use")
+    parser.add_argument("--profiles", type=int, default=1, help="profiles scraped at the same time")
+    parser.add_argument("--parse-processes", default="0",
+                        help="comma separated parse pool sizes to compare, 0 parses in the scraping threads")
+    args = parser.parse_args(argv)
+
+    print("%-12s %7s %7s %6s %8s %8s %8s %8s %8s %11s" % ("parser", "workers", "parsers", "jobs", "requests",
+                                                             "pages/s", "p50 ms", "p99 ms", "peak MB", "parse CPU s"))
+    for parser_name in args.parsers.split(","):
+        setParser(parser_name.strip())
+        for workers in args.workers.split(","):
+            for processes in args.parse_processes.split(","):
+                with MockDuunitori(pages=args.pages, jobs_per_page=args.jobs_per_page, latency=args.latency,
+                                   jitter=args.jitter, error_rate=args.error_rate) as server:
+                    result = run(server, int(workers), memory=not args.no_memory, profiles=args.profiles,
+                                 parse_processes=int(processes))
+                print("%-12s %7d %7d %6d %8d %8.1f %8.1f %8.1f %8.1f %11.2f" % (
+                    parser_name, result["workers"], result["parse_processes"], result["jobs"], result["requests"],
+                    result["pages_per_second"], result["p50_ms"], result["p99_ms"], result["peak_mb"],
+                    result["parse_cpu_seconds"]))
+
+
+if __name__ == "__main__":
+    main()
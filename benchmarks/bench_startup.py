@@ -0,0 +1,83 @@
+"""
+Cold start benchmark for the desktop app and the headless runner.
+
+Every case runs in a fresh Python process, --repeat times, and reports the median and best of:
+process ms -- wall time of the whole process, interpreter start included
+work ms -- time spent on the case itself inside the process, imports included
+The cases:
+python -- an empty interpreter, what every process costs anyway
+import appy / import cli -- importing the app and the command line runner, neither should load requests or the
+                            HTML parsers, the modules that did get loaded are listed
+cli --help -- the command line runner up to parsing its arguments
+headless scraper -- building a Duunitori scraper like cli.py does, this one loads the HTTP stack and the parsers
+window -- the app window up to its first paint, needs a display and is skipped without one
+
+Usage:
+python bench_startup.py --repeat 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+# Modules that should only be loaded when a scrape needs them
+HEAVY = ("requests", "urllib3", "bs4", "selectolax", "lxml", "pyarrow")
+
+CASES = (("python", "pass"),
+         ("import appy", "import appy"),
+         ("import cli", "import cli"),
+         ("cli --help", "import sys, cli\nsys.argv = ['cli.py', '--help']\ntry:\n    cli.parseArgs()\n"
+                        "except SystemExit:\n    pass"),
+         ("headless scraper", "import duunitori\nduunitori.Scraper.fromSettings({'cache': None, 'seen': None, "
+                              "'checkpoints': None}).close()"),
+         ("window", "import appy\napp = appy.App()\napp.update()"),
+         )
+
+# Times the case inside the process and reports the heavy modules it loaded, the window case is destroyed after
+TEMPLATE = """
+import sys, time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print("%%f %%s" %% (elapsed, ",".join(name for name in %r if name in sys.modules)))
+if "app" in globals():
+    app.destroy()
+"""
+
+
+def runCase(code):
+    """
+    Returns (process seconds, work seconds, heavy modules loaded), None if the case failed
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", TEMPLATE % (code, HEAVY)], cwd=SRC, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    work, _, loaded = result.stdout.strip().splitlines()[-1].partition(" ")
+    return elapsed, float(work), loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold start of the app and the headless runner.")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print("%-18s %10s %10s %10s %10s  heavy modules loaded" % ("case", "process ms", "best", "work ms", "best"))
+    for name, code in CASES:
+        runs = [runCase(code) for _ in range(args.repeat)]
+        if None in runs:
+            print("%-18s skipped, it failed (no display for the window?)" % name)
+            continue
+        process = [run[0] * 1000 for run in runs]
+        work = [run[1] * 1000 for run in runs]
+        print("%-18s %10.1f %10.1f %10.1f %10.1f  %s" % (name, statistics.median(process), min(process),
+                                                         statistics.median(work), min(work), runs[-1][2] or "-"))
+
+
+if __name__ == "__main__":
+    main()
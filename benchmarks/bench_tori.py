@@ -0,0 +1,106 @@
+"""
+Tori.fi watcher polling benchmark, run against the local stand-in server.
+
+Polls every search a few rounds, adding new listings and dropping some prices on the server between the rounds,
+and checks every new listing and price drop gets flagged exactly once. Some of the drops are on older listings,
+on the second and third page of their search, those only have to be flagged by the next rescan. Reports per round:
+requests -- requests the server got, 304s -- how many of them were answered with 304 Not Modified
+kB -- response bodies sent, ms -- wall time of the round, and the new listings and price drops found,
+rescan rounds are marked with *
+
+Usage:
+python bench_tori.py --searches 20 --listings 5000 --rounds 5 --new 10 --drops 5 --deep-drops 5 --rescan-every 3
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mock_tori import MockTori, ITEMS  # noqa: E402
+from engine import Engine  # noqa: E402
+from fetcher import Fetcher  # noqa: E402
+from cache import ResponseCache, CachedSession  # noqa: E402
+from session import HttpSession  # noqa: E402
+from tori import Watcher, WatchStore, Polled  # noqa: E402
+
+
+def pollRound(watcher, searches):
+    new = set()
+    drops = set()
+    unchanged = 0
+    for search in searches:
+        for event in watcher.poll(search):
+            if isinstance(event, dict) and event["event"] == "new":
+                new.add(event["id"])
+            elif isinstance(event, dict) and event["event"] == "drop":
+                drops.add(event["id"])
+            elif isinstance(event, Polled):
+                unchanged += event.unchanged
+    return new, drops, unchanged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark polling Tori.fi searches.")
+    parser.add_argument("--searches", type=int, default=len(ITEMS), help="searches polled, one per item word")
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--new", type=int, default=10, help="new listings added before every round")
+    parser.add_argument("--drops", type=int, default=5, help="price drops before every round")
+    parser.add_argument("--deep-drops", type=int, default=5, help="price drops on older listings before every round")
+    parser.add_argument("--rescan-every", type=int, default=3, help="polls of a search between rescans")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp()
+    searches = [ITEMS[i % len(ITEMS)] + ("" if i < len(ITEMS) else " " + str(i)) for i in range(args.searches)]
+    # Searches past the item words don't match anything, they cost a request per poll all the same
+    with MockTori(listings=args.listings, latency=args.latency) as server:
+        session = CachedSession(HttpSession(), ResponseCache(os.path.join(folder, "cache.sqlite")))
+        engine = Engine(Fetcher(workers=4, rate=0, session=session))
+        store = WatchStore(os.path.join(folder, "tori.sqlite"))
+        watcher = Watcher(engine, store, base_url=server.url, rescan_every=args.rescan_every)
+        for search in searches:
+            store.addSearch(search)
+
+        print("round  requests   304s        kB        ms    new  drops  unchanged")
+        ok = True
+        # Drops on older listings not flagged yet
+        pending = set()
+        for round_number in range(args.rounds + 1):
+            added = dropped = set()
+            if round_number:
+                added = set(server.add(args.new))
+                dropped = set(server.dropPrices(args.drops)) - added
+                # With 50 listings a page, the search of every item word has these about 50-150 listings down
+                pending |= set(server.dropPrices(args.deep_drops, newest=14 * len(ITEMS) * 10,
+                                                 skip=6 * len(ITEMS) * 10)) - added - dropped
+            rescan = round_number % args.rescan_every == 0
+            requests, not_modified, sent = server.requests, server.not_modified, server.bytes
+            start = time.perf_counter()
+            new, drops, unchanged = pollRound(watcher, searches)
+            elapsed = (time.perf_counter() - start) * 1000
+            print("%4d%s  %8d  %5d  %8.1f  %8.1f  %5d  %5d  %9d" % (round_number, "*" if rescan else " ",
+                                                                   server.requests - requests,
+                                                                   server.not_modified - not_modified,
+                                                                   (server.bytes - sent) / 1024, elapsed, len(new),
+                                                                   len(drops), unchanged))
+            # A deep drop may show up early, when its page gets read anyway, but a rescan must have all of them
+            expected = dropped | pending if rescan else dropped
+            if round_number and (new != added or not expected <= drops <= dropped | pending):
+                ok = False
+                print("       expected %d new and %d drops" % (len(added), len(expected)))
+            pending -= drops
+        engine.close()
+        store.close()
+    shutil.rmtree(folder, ignore_errors=True)
+    print("every change flagged once" if ok else "MISSED CHANGES")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Local stand-in for duunitori.fi serving synthetic listing and detail pages.
+
+Listing pages (/tyopaikat?haku=...&sivu=N) have jobs_per_page job-box__hover result links and pagination__pagenum
+links up to the last page, detail pages (/tyopaikat/tyo/...) have a header__title and an info-listing cell with
+info-listing__block blocks, like the real site. Responses can be delayed and a share of them can fail with 503,
+to see how the scraper copes with a slow or flaky site. ETags are sent, so conditional requests get 304s.
+
+Run on its own:
+python mock_server.py --port 8000 --pages 50 --latency 0.05 --error-rate 0.01
+and point the scraper to it with the base_url setting, eg. python ../src/cli.py --base-url http://127.0.0.1:8000/
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import hashlib
+import random
+import time
+
+LOCATIONS = ("Helsinki", "Espoo", "Tampere", "Oulu", "Turku", "Jyväskylä")
+FIELDS = ("Ohjelmistot ja IT", "Rakentaminen", "Terveydenhuolto", "Logistiikka")
+TITLES = ("Ohjelmistokehittäjä", "Myyjä", "Sairaanhoitaja", "Kuljettaja", "Projektipäällikkö")
+
+
+def listingPage(page, pages, jobs_per_page, padding=0):
+    results = "".join('<div class="job-box"><a class="job-box__hover gtm-search-result" '
+                      'href="tyopaikat/tyo/tyopaikka-%d-%d">Job</a></div>\n' % (page, i)
+                      for i in range(jobs_per_page))
+    pagination = ""
+    if pages > 1:
+        pagination = "".join('<a class="pagination__pagenum" href="/tyopaikat?haku=x&amp;sivu=%d">%d</a>' % (i, i)
+                             for i in sorted({1, max(1, page - 1), page, min(pages, page + 1), pages}))
+    # Padding stands in for the navigation, scripts and footer of the real pages
+    return ("<html><head><title>Työpaikat</title></head><body>\n<div class=\"results\">\n%s</div>\n"
+            "<nav class=\"pagination\">%s</nav>\n<div class=\"footer\">%s</div></body></html>"
+            % (results, pagination, "<p>lorem ipsum</p>" * padding))
+
+
+def detailPage(job_id, padding=0):
+    rng = random.Random(job_id)
+    blocks = (("Työpaikan sijainti", rng.choice(LOCATIONS)),
+              ("Toiminimi", "Yritys %d Oy" % rng.randrange(1000)),
+              ("Y-tunnus", "%07d-%d" % (rng.randrange(10 ** 7), rng.randrange(10))),
+              ("Toimiala", rng.choice(FIELDS)),
+              )
+    info = "".join('<div class="info-listing__block"><h4 class="info-listing__heading">%s</h4>'
+                   '<div class="info-listing__value"><span>%s</span></div></div>\n' % block for block in blocks)
+    return ('<html><head><title>Job</title></head><body>\n<h1 class="header__title">%s %s</h1>\n'
+            '<div class="description">%s</div>\n<div class="1/1 grid__cell info-listing">\n%s</div>\n</body></html>'
+            % (rng.choice(TITLES), job_id, "<p>lorem ipsum</p>" * padding, info))
+
+
+class MockServer:
+    """
+    Threaded local HTTP server answering GETs with respond() of the subclass. Keep-alive is on and ETags are sent,
+    so conditional requests get 304s.
+    """
+
+    content_type = "text/html; charset=utf-8"
+
+    def __init__(self, port=0):
+        self.__server = ThreadingHTTPServer(("127.0.0.1", port), self.__handler())
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self):
+        host, port = self.__server.server_address[:2]
+        return "http://%s:%d/" % (host, port)
+
+    def start(self):
+        self.__thread = Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, path):
+        """
+        Returns (status, body) for a request path
+        """
+        raise NotImplementedError
+
+    def sent(self, size):
+        """
+        Called for every response body sent, with 0 for a 304
+        """
+
+    def __handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes, with Nagle on every keep-alive response would wait
+            # for the delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body = mock.respond(self.path)
+                body = body.encode("utf-8")
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    mock.sent(0)
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                mock.sent(len(body))
+                self.send_response(status)
+                self.send_header("Content-Type", mock.content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if status == 200:
+                    self.send_header("ETag", etag)
+                if status == 503:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+class MockDuunitori(MockServer):
+    """
+    pages -- number of listing pages for every search
+    jobs_per_page -- results on a listing page
+    latency -- seconds every response is delayed, jitter adds up to that much random extra delay
+    error_rate -- share of requests answered with 503
+    padding -- filler paragraphs added to every page to make them closer to the real page sizes
+    """
+
+    def __init__(self, port=0, pages=10, jobs_per_page=20, latency=0.0, jitter=0.0, error_rate=0.0, padding=200,
+                 seed=0):
+        self.pages = pages
+        self.jobs_per_page = jobs_per_page
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.padding = padding
+        self.requests = 0
+        self.errors = 0
+        self.__random = random.Random(seed)
+        self.__lock = Lock()
+        super().__init__(port)
+
+    def respond(self, path):
+        with self.__lock:
+            self.requests += 1
+            delay = self.latency + self.__random.random() * self.jitter
+            fail = self.__random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return 503, "<html><body>Service unavailable</body></html>"
+
+        url = urlsplit(path)
+        if url.path.rstrip("/") == "/tyopaikat":
+            page = int(parse_qs(url.query).get("sivu", ["1"])[0])
+            if page > self.pages:
+                return 404, "<html><body>Not found</body></html>"
+            return 200, listingPage(page, self.pages, self.jobs_per_page, self.padding)
+        if url.path.startswith("/tyopaikat/tyo/"):
+            return 200, detailPage(url.path.rsplit("/", 1)[-1], self.padding)
+        return 404, "<html><body>Not found</body></html>"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic Duunitori pages.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--jobs-per-page", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockDuunitori(args.port, args.pages, args.jobs_per_page, args.latency, args.jitter, args.error_rate)
+    print("Serving on " + server.url)
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Local stand-in for Tori.fi's JSON search api, serving synthetic listings newest first.
+
+Searches (/recommerce-search-page/api/search/SEARCH_ID_BAP_COMMON?q=...&page=N) match the words of the listing
+titles, an empty search matches everything. New listings and price drops can be added while the server runs,
+to see what a poll picks up. ETags are sent, so conditional requests get 304s, and the bytes of the response
+bodies sent are counted.
+
+Run on its own:
+python mock_tori.py --port 8001 --listings 2000
+and point the watcher to it with Watcher(engine, store, base_url="http://127.0.0.1:8001/")
+"""
+
+from threading import Lock
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import json
+import random
+import time
+from mock_server import MockServer
+
+ITEMS = ("jakkara", "tuoli", "pöytä", "sohva", "hylly", "lamppu", "polkupyörä", "sukset", "kitara", "näyttö")
+ADJECTIVES = ("vanha", "uusi", "hyväkuntoinen", "puinen", "musta", "valkoinen", "iso", "pieni")
+LOCATIONS = ("Helsinki", "Espoo", "Tampere", "Oulu", "Turku", "Jyväskylä")
+
+
+class MockTori(MockServer):
+    """
+    listings -- listings there are at the start
+    per_page -- listings on a search page
+    latency -- seconds every response is delayed
+    """
+
+    content_type = "application/json; charset=utf-8"
+
+    def __init__(self, port=0, listings=1000, per_page=50, latency=0.0, seed=0):
+        self.per_page = per_page
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes = 0
+        self.__random = random.Random(seed)
+        self.__lock = Lock()
+        # Newest last, ids grow like Tori's
+        self.__listings = []
+        self.__next_id = 20000000
+        self.add(listings)
+        super().__init__(port)
+
+    def add(self, count):
+        """
+        Adds count new listings, returns their ids
+        """
+        ids = []
+        with self.__lock:
+            for _ in range(count):
+                self.__next_id += self.__random.randrange(1, 20)
+                title = "%s %s" % (self.__random.choice(ADJECTIVES), self.__random.choice(ITEMS))
+                self.__listings.append({"id": str(self.__next_id),
+                                        "heading": title.capitalize(),
+                                        "words": set(title.split()),
+                                        "price": {"amount": self.__random.randrange(5, 500), "currency_code": "EUR"},
+                                        "location": self.__random.choice(LOCATIONS),
+                                        "timestamp": int(time.time() * 1000),
+                                        })
+                ids.append(self.__next_id)
+        return ids
+
+    def dropPrices(self, count, newest=200, skip=0):
+        """
+        Drops the price of count listings picked from the newest ones, leaving out the skip newest of them.
+        Returns their ids.
+        """
+        with self.__lock:
+            pool = self.__listings[-newest:len(self.__listings) - skip]
+            picked = self.__random.sample(pool, min(count, len(pool)))
+            for listing in picked:
+                listing["price"] = dict(listing["price"], amount=max(1, listing["price"]["amount"] * 8 // 10))
+        return [int(listing["id"]) for listing in picked]
+
+    def search(self, query, page):
+        words = set(query.lower().split())
+        with self.__lock:
+            found = [listing for listing in reversed(self.__listings) if words <= listing["words"]]
+        last = max(1, -(-len(found) // self.per_page))
+        docs = [{key: value for key, value in listing.items() if key != "words"}
+                for listing in found[(page - 1) * self.per_page:page * self.per_page]]
+        return {"docs": docs, "metadata": {"paging": {"current": page, "last": last}, "result_size": len(found)}}
+
+    def respond(self, path):
+        with self.__lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(path)
+        if not url.path.endswith("/api/search/SEARCH_ID_BAP_COMMON"):
+            return 404, '{"error": "not found"}'
+        params = parse_qs(url.query)
+        page = int(params.get("page", ["1"])[0])
+        return 200, json.dumps(self.search(params.get("q", [""])[0], page), ensure_ascii=False)
+
+    def sent(self, size):
+        with self.__lock:
+            if size:
+                self.bytes += size
+            else:
+                self.not_modified += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic Tori.fi search results.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--listings", type=int, default=1000)
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--new-every", type=float, default=0, help="seconds between new listings, 0 for none")
+    args = parser.parse_args()
+    server = MockTori(args.port, args.listings, args.per_page, args.latency)
+    print("Serving on " + server.url)
+    server.start()
+    try:
+        while True:
+            time.sleep(args.new_every or 1)
+            if args.new_every:
+                server.add(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Alko price list: bulk ingest of the whole catalogue and a price per alcohol index.
+
+Alko publishes its whole catalogue as one Excel price list, so instead of scraping the product pages the list is
+downloaded once (through the engine, so it's cached and revalidated with ETags) and stream-parsed: the xlsx is read
+straight from the zip with iterparse, one row at a time, without building the sheet in memory or needing openpyxl.
+
+Products go into PriceList, a columnar store with one array per column. Euros per gram of alcohol is computed on
+ingest, and sorted row orders are kept for the sortable columns, so top-N queries walk an index instead of sorting
+~10k products every time. Every row is fingerprinted, and a new price list only touches the rows that changed.
+PriceStore keeps the ingested list in SQLite between runs, writing only the changed rows too.
+"""
+
+from array import array
+from xml.etree.ElementTree import iterparse
+import hashlib
+import io
+import re
+import zipfile
+from database import openDatabase
+from engine import SitePlugin
+
+PRODUCT_URL = "https://www.alko.fi/tuotteet/%s/"
+PRICE_LIST_URL = ("https://www.alko.fi/INTERSHOP/static/WFS/Alko-OnlineShop-Site/-/Alko-OnlineShop/fi_FI/"
+                  "Alkon%20Hinnasto%20Tekstitiedostona/alkon-hinnasto-tekstitiedostona.xlsx")
+
+# Price list headings and the product fields they map to, other columns are ignored
+HEADINGS = {"Numero": "number",
+            "Nimi": "name",
+            "Valmistaja": "producer",
+            "Pullokoko": "size",
+            "Hinta": "price",
+            "Litrahinta": "litre_price",
+            "Tyyppi": "type",
+            "Valmistusmaa": "country",
+            "Alkoholi-%": "abv",
+            }
+TEXT_FIELDS = ("number", "name", "producer", "type", "country")
+NUMBER_FIELDS = ("size", "price", "litre_price", "abv", "eur_per_gram")
+# Columns with a sorted index
+SORTABLE = ("eur_per_gram", "price", "litre_price", "abv", "size", "name")
+
+# Density of ethanol, g/ml
+ETHANOL_DENSITY = 0.789
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_number = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def _toNumber(value):
+    """
+    Number out of a cell, also from text like "0,75 l" or "4,7 %". None if there's none.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _number.search(value)
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def _column(ref):
+    """
+    Zero based column index of a cell reference like "AB12"
+    """
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - 64
+    return index - 1
+
+
+def _sheetPath(archive):
+    """
+    Path of the first worksheet in the workbook
+    """
+    names = archive.namelist()
+    if "xl/workbook.xml" in names and "xl/_rels/workbook.xml.rels" in names:
+        with archive.open("xl/workbook.xml") as f:
+            for event, element in iterparse(f):
+                if element.tag == _NS + "sheet":
+                    rel_id = element.get(_REL_NS + "id")
+                    break
+            else:
+                rel_id = None
+        with archive.open("xl/_rels/workbook.xml.rels") as f:
+            for event, element in iterparse(f):
+                if element.get("Id") == rel_id:
+                    target = element.get("Target").lstrip("/")
+                    return target if target.startswith("xl/") else "xl/" + target
+    return sorted(name for name in names if name.startswith("xl/worksheets/sheet"))[0]
+
+
+def readRows(source):
+    """
+    Streams the rows of the first sheet of an xlsx file as lists of cell values.
+    source is a path, a file object or the file's bytes. Numbers come out as strings like in the sheet xml.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as archive:
+        shared = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            with archive.open("xl/sharedStrings.xml") as f:
+                for event, element in iterparse(f):
+                    if element.tag == _NS + "si":
+                        shared.append("".join(text.text or "" for text in element.iter(_NS + "t")))
+                        element.clear()
+
+        with archive.open(_sheetPath(archive)) as f:
+            row = []
+            for event, element in iterparse(f):
+                if element.tag == _NS + "c":
+                    kind = element.get("t")
+                    if kind == "inlineStr":
+                        value = "".join(text.text or "" for text in element.iter(_NS + "t"))
+                    else:
+                        value = element.findtext(_NS + "v")
+                        if kind == "s" and value is not None:
+                            value = shared[int(value)]
+                    ref = element.get("r")
+                    index = _column(ref) if ref else len(row)
+                    # Empty cells are left out of the xml
+                    row.extend([None] * (index - len(row)))
+                    row.append(value)
+                    element.clear()
+                elif element.tag == _NS + "row":
+                    yield row
+                    row = []
+                    element.clear()
+
+
+def readProducts(source):
+    """
+    Streams the products of a price list as dictionaries with the HEADINGS fields and eur_per_gram.
+    The rows above the heading row (title, notes) are skipped.
+    """
+    columns = None
+    for row in readRows(source):
+        if columns is None:
+            if row and row[0] == "Numero":
+                columns = [(index, HEADINGS[heading]) for index, heading in enumerate(row) if heading in HEADINGS]
+            continue
+        product = {field: row[index] if index < len(row) else None for index, field in columns}
+        if not product.get("number"):
+            continue
+        for field in ("size", "price", "litre_price", "abv"):
+            product[field] = _toNumber(product.get(field))
+        product["eur_per_gram"] = eurPerGram(product["price"], product["size"], product["abv"])
+        yield product
+    if columns is None:
+        raise ValueError("Not an Alko price list, the heading row is missing")
+
+
+def eurPerGram(price, size, abv):
+    """
+    Euros per gram of alcohol for a bottle of size litres, None for alcohol-free products
+    """
+    if not price or not size or not abv:
+        return None
+    return price / (size * 1000 * abv / 100 * ETHANOL_DENSITY)
+
+
+def fingerprint(product):
+    """
+    Short hash of the product's fields, for telling which rows changed between price lists
+    """
+    data = "\x1f".join("" if product.get(field) is None else str(product.get(field))
+                       for field in TEXT_FIELDS + NUMBER_FIELDS)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PriceList:
+    """
+    Columnar in-memory store of the products. Text columns are lists, number columns are arrays of doubles with
+    NaN for missing values. Rows of products dropped from the price list are only marked deleted and reused,
+    so a new price list doesn't rebuild the whole store.
+    """
+
+    def __init__(self):
+        self.columns = {field: [] for field in TEXT_FIELDS}
+        self.columns.update({field: array("d") for field in NUMBER_FIELDS})
+        self.rows = {}
+        self.__fingerprints = []
+        self.__deleted = set()
+        self.__orders = {}
+        self.__types = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def ingest(self, products):
+        """
+        Brings the store up to date with a full price list, only the new and changed rows are written.
+        Products missing from the list are deleted. Returns (added, changed, removed) counts.
+        """
+        added = changed = 0
+        present = set()
+        for product in products:
+            number = product["number"]
+            present.add(number)
+            digest = fingerprint(product)
+            row = self.rows.get(number)
+            if row is not None and self.__fingerprints[row] == digest:
+                continue
+            if row is None:
+                added += 1
+                row = self.__newRow(number)
+            else:
+                changed += 1
+            self.__set(row, product, digest)
+
+        removed = [number for number in self.rows if number not in present]
+        for number in removed:
+            self.__deleted.add(self.rows.pop(number))
+        if added or changed or removed:
+            self.__orders.clear()
+            self.__types.clear()
+        return added, changed, len(removed)
+
+    def product(self, row):
+        product = {field: column[row] for field, column in self.columns.items()}
+        for field in NUMBER_FIELDS:
+            if product[field] != product[field]:
+                product[field] = None
+        return product
+
+    def products(self):
+        for row in sorted(self.rows.values()):
+            yield self.product(row)
+
+    def types(self):
+        """
+        Product types in the list, alphabetically
+        """
+        return sorted(self.__typeIndex())
+
+    def order(self, column, reverse=False):
+        """
+        Live rows sorted by column, rows without a value come last
+        """
+        key = (column, reverse)
+        rows = self.__orders.get(key)
+        if rows is None:
+            values = self.columns[column]
+            live = sorted(self.rows.values())
+            if column in NUMBER_FIELDS:
+                present = [row for row in live if values[row] == values[row]]
+                missing = [row for row in live if values[row] != values[row]]
+                rows = sorted(present, key=values.__getitem__, reverse=reverse) + missing
+            else:
+                rows = sorted(live, key=lambda row: (values[row] or "").lower(), reverse=reverse)
+            self.__orders[key] = rows
+        return rows
+
+    def top(self, n=50, by="eur_per_gram", reverse=False, type=None, query=None):
+        """
+        First n products by the sorted index of by, optionally only of one type and with query in the name.
+        Returns product dictionaries.
+        """
+        rows = self.order(by, reverse)
+        allowed = self.__typeIndex().get(type) if type else None
+        if type and allowed is None:
+            return []
+        query = query.lower() if query else None
+        names = self.columns["name"]
+        found = []
+        for row in rows:
+            if allowed is not None and row not in allowed:
+                continue
+            if query and query not in (names[row] or "").lower():
+                continue
+            found.append(self.product(row))
+            if len(found) >= n:
+                break
+        return found
+
+    def __typeIndex(self):
+        if not self.__types and self.rows:
+            types = self.columns["type"]
+            for row in self.rows.values():
+                self.__types.setdefault(types[row] or "", set()).add(row)
+        return self.__types
+
+    def __newRow(self, number):
+        if self.__deleted:
+            row = self.__deleted.pop()
+        else:
+            row = len(self.__fingerprints)
+            for field in TEXT_FIELDS:
+                self.columns[field].append(None)
+            for field in NUMBER_FIELDS:
+                self.columns[field].append(float("nan"))
+            self.__fingerprints.append(None)
+        self.rows[number] = row
+        return row
+
+    def __set(self, row, product, digest):
+        for field in TEXT_FIELDS:
+            self.columns[field][row] = product.get(field)
+        for field in NUMBER_FIELDS:
+            value = product.get(field)
+            self.columns[field][row] = float("nan") if value is None else value
+        self.__fingerprints[row] = digest
+
+
+class PriceStore:
+    """
+    The latest ingested price list in SQLite, so the app has the products without downloading the list again.
+    Like PriceList, an ingest only writes the rows whose fingerprint changed.
+    path -- SQLite database file, see openDatabase
+    """
+
+    def __init__(self, path):
+        self.__db = openDatabase(path)
+        self.__db.execute("CREATE TABLE IF NOT EXISTS products (number TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, "
+                          + ", ".join(field + " TEXT" for field in TEXT_FIELDS if field != "number") + ", "
+                          + ", ".join(field + " REAL" for field in NUMBER_FIELDS) + ")")
+        self.__db.commit()
+
+    def ingest(self, products):
+        """
+        Writes the new and changed products and deletes the ones missing from the list.
+        Returns (added, changed, removed) counts.
+        """
+        known = dict(self.__db.execute("SELECT number, fingerprint FROM products"))
+        fields = TEXT_FIELDS + NUMBER_FIELDS
+        upserts = []
+        added = changed = 0
+        for product in products:
+            digest = fingerprint(product)
+            old = known.pop(product["number"], None)
+            if old == digest:
+                continue
+            if old is None:
+                added += 1
+            else:
+                changed += 1
+            upserts.append((digest,) + tuple(product.get(field) for field in fields))
+        with self.__db:
+            self.__db.executemany("INSERT OR REPLACE INTO products (fingerprint, " + ", ".join(fields) + ") VALUES ("
+                                  + ", ".join("?" * (len(fields) + 1)) + ")", upserts)
+            self.__db.executemany("DELETE FROM products WHERE number = ?", [(number,) for number in known])
+        return added, changed, len(known)
+
+    def products(self):
+        fields = TEXT_FIELDS + NUMBER_FIELDS
+        for row in self.__db.execute("SELECT " + ", ".join(fields) + " FROM products"):
+            yield dict(zip(fields, row))
+
+    def close(self):
+        self.__db.close()
+
+
+class AlkoPlugin(SitePlugin):
+    """
+    Downloads the price list through the engine, the whole catalogue comes from the one file
+    """
+
+    name = "alko"
+    title = "Alko"
+    columns = (("name", "Name"),
+               ("type", "Type"),
+               ("size", "Size l"),
+               ("price", "Price €"),
+               ("abv", "Alcohol %"),
+               ("eur_per_gram", "€ / g alcohol"),
+               ("litre_price", "€ / l"),
+               ("producer", "Producer"),
+               ("country", "Country"),
+               ("number", "Number"),
+               )
+    link = "number"
+    query_label = "Name"
+    types = {field: "float64" for field in NUMBER_FIELDS}
+    # Alko updates the list daily at most
+    ttl = 12 * 60 * 60
+    max_pages = 1
+
+    def __init__(self, url=PRICE_LIST_URL):
+        self.url = url
+
+    def startUrls(self, query):
+        return [self.url]
+
+    def parse(self, url, content):
+        return list(readProducts(content)), []
@@ -17,11 +17,20 @@ from tkinter import filedialog
 from tkinter import ttk
 from tkinter import messagebox
 from threading import Thread
-import time
-import requests
-from bs4 import BeautifulSoup
+import queue
+import json
 import os
+import time
 import webbrowser
+from duunitori import Scraper, Job, Progress, SETTINGS
+from engine import Engine, Finished
+from tori import Watcher, ToriPlugin, Polled
+from alko import AlkoPlugin, PriceList, PriceStore, readProducts, PRODUCT_URL
+from reddit import RedditPlugin
+from scheduler import Scheduler
+from profiles import loadProfileFiles, formatProfile, profileFormat
+from exporters import COLUMNS, openExporter
+from results import ResultStore
 
 
 class Style(ttk.Style):
@@ -68,18 +77,45 @@ class App(tk.Tk):
         # Notebook widget to use as tab control in the window
         self.__tabControl = ttk.Notebook(self)
         self.__tabControl.pack(expand=1, fill="both")
+        # Tabs are built when they're first opened
+        self.__tabControl.bind("<<NotebookTabChanged>>",
+                               lambda event: self.nametowidget(self.__tabControl.select()).ensureBuilt())
+
+        # The site plugin tabs all run on one engine, so they share the fetcher and its connection pool and cache.
+        # The fetcher is made when the first crawl starts.
+        self.__engine = Engine.fromSettings()
 
-        # Create the 3 tabs and pass tab control for target reference
+        # Create the tabs and pass tab control for target reference
         self.__duunitoriScraper = DuunitoriScraper(self.__tabControl)
-        self.__alko = AlkoScraper(self.__tabControl)
-        self.__tori = ToriScraper(self.__tabControl)
-        self.__reddit = RedditScraper(self.__tabControl)
+        self.__alko = AlkoScraper(self.__tabControl, self.__engine)
+        self.__tori = ToriScraper(self.__tabControl, self.__engine)
+        self.__reddit = RedditScraper(self.__tabControl, self.__engine)
 
         # Duunitori menu
         self.__duunitoriMenu.add_command(label="New search profile", command=DuunitoriScraper.openSettings)
-        self.__duunitoriMenu.add_command(label="Open search profile", command=self.__duunitoriScraper.loadSearch)
-
-        self.mainloop()
+        self.__duunitoriMenu.add_command(label="Open search profile",
+                                         command=lambda: self.__duunitoriScraper.open().loadSearch())
+        self.__duunitoriMenu.add_command(label="Export results",
+                                         command=lambda: self.__duunitoriScraper.open().exportResults())
+        self.__duunitoriMenu.add_command(label="Statistics", command=lambda: self.__duunitoriScraper.open().openStats())
+        self.__duunitoriMenu.add_separator()
+        self.__offlineVar = tk.BooleanVar(value=False)
+        self.__duunitoriMenu.add_checkbutton(label="Offline mode (use cached pages only)", variable=self.__offlineVar,
+                                             command=lambda: self.__duunitoriScraper.setOffline(
+                                                 self.__offlineVar.get()))
+        self.__resumeVar = tk.BooleanVar(value=False)
+        self.__duunitoriMenu.add_checkbutton(label="Resume interrupted searches", variable=self.__resumeVar,
+                                             command=lambda: self.__duunitoriScraper.setResume(self.__resumeVar.get()))
+
+        # Alko menu
+        self.__alkoMenu.add_command(label="Download price list", command=lambda: self.__alko.open().download())
+        self.__alkoMenu.add_command(label="Open price list file", command=lambda: self.__alko.open().openFile())
+        self.__alkoMenu.add_command(label="Export products", command=lambda: self.__alko.open().exportResults())
+
+        # Tori menu
+        self.__toriMenu.add_command(label="Start watching", command=lambda: self.__tori.open().startWatching())
+        self.__toriMenu.add_command(label="Stop watching", command=lambda: self.__tori.open().stopWatching())
+        self.__toriMenu.add_command(label="Export changes", command=lambda: self.__tori.open().exportResults())
 
     @staticmethod
     def openHelp():
@@ -88,46 +124,210 @@ class App(tk.Tk):
 
 class Tab(ttk.Frame):
     """
-    Super class for tabs, inherits from ttk Frame widget. Basically passes the created tab into tab control
+    Super class for tabs, inherits from ttk Frame widget. Basically passes the created tab into tab control.
+    The widgets of a tab are made in build() when the tab is first opened, so the window comes up with empty frames.
     """
 
     def __init__(self, target=None, name=None):
         super().__init__(target)
         target.add(self, text=name)
+        self.built = False
+
+    def build(self):
+        """
+        Makes the tab's widgets, subclasses put them here instead of __init__
+        """
+
+    def ensureBuilt(self):
+        if not self.built:
+            self.built = True
+            self.build()
+
+    def open(self):
+        """
+        Shows the tab, building it first if needed. Returns the tab, so menu commands can call it right away.
+        """
+        self.master.select(self)
+        self.ensureBuilt()
+        return self
+
+    def exportRecords(self, records, columns=COLUMNS, types=None, title="Export results", keepOpen=False):
+        """
+        Asks for a file and exports records to CSV, JSON Lines or Parquet, picked by the file extension.
+        With keepOpen the exporter is returned open for more records, otherwise it's closed.
+        Returns None if the dialog was cancelled or the export failed.
+        """
+        path = os.path.dirname(os.getcwd()) + "/exports"
+        filename = filedialog.asksaveasfilename(initialdir=path, title=title, defaultextension=".csv",
+                                                filetypes=(("CSV", "*.csv"), ("JSON Lines", "*.jsonl"),
+                                                           ("Parquet", "*.parquet")))
+        if not filename:
+            return None
+        self.closeExport()
+        try:
+            exporter = openExporter(filename, columns=columns, types=types)
+            exporter.writeMany(records)
+        except (OSError, ValueError, ImportError) as e:
+            messagebox.showerror(title="Export error", message=e)
+            return None
+        if not keepOpen:
+            exporter.close()
+        return exporter
+
+    def closeExport(self):
+        """
+        Closes an export still taking records, tabs streaming their results to one override this
+        """
+
+
+class ScrapeWorker:
+    """
+    Runs a scrape event generator in a worker thread. The events are handed over to the Tk thread through
+    a thread-safe queue that is polled with after(), so widgets are only ever touched from the Tk thread.
+    Events are buffered and passed to onEvents as lists, at most batch events every interval milliseconds,
+    so a flood of results doesn't freeze the window.
+    Exceptions raised by the scrape are passed to onEvents as events too. onDone is called after the last batch.
+    An exception from onEvents is shown once and the polling goes on, so onDone still gets called.
+    """
+
+    def __init__(self, widget, events, onEvents, onDone=None, interval=100, batch=500):
+        self.__widget = widget
+        self.__events = events
+        self.__onEvents = onEvents
+        self.__onDone = onDone
+        self.__interval = interval
+        self.__batch = batch
+        self.__queue = queue.Queue()
+        self.__thread = Thread(target=self.__run, daemon=True)
+        self.__handlerFailed = False
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.__thread.start()
+        self.__widget.after(self.__interval, self.__poll)
+
+    def __run(self):
+        try:
+            for event in self.__events:
+                self.__queue.put(event)
+        except Exception as e:
+            self.__queue.put(e)
+        finally:
+            # None tells the poller that the thread is done
+            self.__queue.put(None)
+
+    def __poll(self):
+        batch = []
+        done = False
+        while len(batch) < self.__batch:
+            try:
+                event = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                done = True
+                break
+            batch.append(event)
+
+        if batch:
+            try:
+                self.__onEvents(batch)
+            except Exception as e:
+                # eg. a failing export write, the rest of the batches would likely fail the same way
+                if not self.__handlerFailed:
+                    self.__handlerFailed = True
+                    messagebox.showerror(title="Error", message=e)
+        if done:
+            self.running = False
+            if self.__onDone is not None:
+                self.__onDone()
+            return
+        # Work through a backlog quickly, but still let Tk handle its own events between the batches
+        delay = 1 if self.__queue.qsize() else self.__interval
+        self.__widget.after(delay, self.__poll)
 
 
 class DuunitoriScraper(Tab):
-    stop_scrape = True
-    iid = 0
-    profile = {"keywords": [""],
-               "locations": [""],
-               "searchDesc": False,
-               }
+    # Opened search profiles, all of them are scraped at the same time
+    profiles = [{"keywords": [""],
+                 "locations": [""],
+                 "searchDesc": False,
+                 "name": "default",
+                 }]
+    # Concurrency, rate limit, cache and seen store settings, see duunitori.SETTINGS
+    # Found jobs are flushed into the job list every refresh_interval ms, at most refresh_batch at a time
+    # parallel is the number of profiles scraped at once
+    # The job list is filtered filter_delay ms after the last key press in the filter box
+    settings = dict(SETTINGS, refresh_interval=100, refresh_batch=500, parallel=4, filter_delay=150)
 
     def __init__(self, target):
         super().__init__(target, "Duunitori Scraper")
 
+        # Made on first use, see the scraper and scheduler properties
+        self.__scraper = None
+        self.__scheduler = None
+        self.__worker = None
+        # Latest (page, pages) of every running profile for the progress bar
+        self.__progress = {}
+        # Exporter that found jobs are streamed to while a scrape is running
+        self.__exporter = None
+        # All the found jobs, the job list shows the ones matching the filter, sorted by the clicked column
+        self.__results = ResultStore()
+        self.__sortColumn = None
+        self.__sortReverse = False
+        self.__filterAfter = None
+
+    @property
+    def scraper(self):
+        """
+        Made on the first scrape, so the window comes up without loading the HTTP stack or opening the stores
+        """
+        if self.__scraper is None:
+            self.__scraper = Scraper.fromSettings(DuunitoriScraper.settings)
+        return self.__scraper
+
+    @property
+    def scheduler(self):
+        if self.__scheduler is None:
+            self.__scheduler = Scheduler(self.scraper, parallel=DuunitoriScraper.settings["parallel"])
+        return self.__scheduler
+
+    def build(self):
+        # Filter box above the job list
+        self.__filterFrame = tk.Frame(self)
+        self.__filterFrame.pack(fill="x")
+        tk.Label(self.__filterFrame, text="Filter:").pack(side="left")
+        self.__filterVar = tk.StringVar()
+        self.__filterVar.trace_add("write", self.scheduleFilter)
+        self.__filterEntry = tk.Entry(self.__filterFrame, textvariable=self.__filterVar)
+        self.__filterEntry.pack(side="left", expand=True, fill="x")
+
         # Frame for holding the job listings and it's scrollbar
         self.__resultFrame = tk.Frame(self)
         self.__resultFrame.pack(expand=True, fill="both")
 
         # Treeview widget for holding all the found job listings
         self.__job_list = ttk.Treeview(self.__resultFrame)
-        self.__job_list["columns"] = ("location", "employer", "vatid", "field", "link")
-        # Leave link column invisible
-        self.__job_list["displaycolumns"] = ("location", "employer", "vatid", "field")
+        # Links and timestamps are only kept in the result store
+        self.__job_list["columns"] = ("location", "employer", "vatid", "field", "profile", "status")
 
         self.__job_list.column("#0", anchor="w", width=200, minwidth=20)
         self.__job_list.column("location", anchor="w", width=200)
         self.__job_list.column("employer", anchor="w", width=200)
         self.__job_list.column("vatid", anchor="center", width=100)
         self.__job_list.column("field", anchor="w", width=200)
-
-        self.__job_list.heading("#0", text="Job title", anchor="w")
-        self.__job_list.heading("location", text="Location", anchor="w")
-        self.__job_list.heading("employer", text="Employer", anchor="w")
-        self.__job_list.heading("vatid", text="VatID", anchor="center")
-        self.__job_list.heading("field", text="Field", anchor="w")
+        self.__job_list.column("profile", anchor="w", width=100)
+        self.__job_list.column("status", anchor="w", width=80)
+
+        # Clicking a heading sorts the job list by it, clicking again reverses the order
+        self.__job_list.heading("#0", text="Job title", anchor="w", command=lambda: self.sortBy("title"))
+        self.__job_list.heading("location", text="Location", anchor="w", command=lambda: self.sortBy("location"))
+        self.__job_list.heading("employer", text="Employer", anchor="w", command=lambda: self.sortBy("employer"))
+        self.__job_list.heading("vatid", text="VatID", anchor="center", command=lambda: self.sortBy("vatid"))
+        self.__job_list.heading("field", text="Field", anchor="w", command=lambda: self.sortBy("field"))
+        self.__job_list.heading("profile", text="Profile", anchor="w", command=lambda: self.sortBy("profile"))
+        self.__job_list.heading("status", text="Status", anchor="w", command=lambda: self.sortBy("status"))
 
         # Include a vertical scrollbar in treeveiw
         self.__scrollbar = ttk.Scrollbar(self.__resultFrame)
@@ -163,6 +363,11 @@ class DuunitoriScraper(Tab):
         self.__startButton = tk.Button(self.__bottomFrame, text="Start", command=self.startScrape)
         self.showStartButton()
 
+        # Status bar for the request counters and timings of the current run
+        self.__statusVar = tk.StringVar()
+        self.__statusLabel = tk.Label(self.__bottomFrame, textvariable=self.__statusVar, anchor="w")
+        self.__statusLabel.grid(row=2, column=0, columnspan=2, sticky="nsew")
+
         # Set the grid weights for rezising to work
         self.__bottomFrame.grid_columnconfigure(0, weight=1)
         self.__bottomFrame.grid_columnconfigure(1, weight=1)
@@ -171,47 +376,30 @@ class DuunitoriScraper(Tab):
 
     def loadSearch(self):
         """
-        Method for loading existing search profiles.
-        Loads the file and parses it, then updates the profile dictionary.
+        Method for loading existing search profiles, several can be selected at once.
+        Loads the files and parses them, then updates the profile list.
         """
         # Get the path for profiles folder
         path = os.path.dirname(os.getcwd()) + "/search_profiles"
 
-        with filedialog.askopenfile(mode="r", initialdir=path, title="Select search profile",
-                                                filetypes=((".txt", "*.txt"),)) as f:
-            try:
-                content = f.readlines()
-                # First 3 splits lines to lists that contains the key: value pairs
-                content = [line.split("=") for line in content]
-                content = [[elem.strip("\n") for elem in line] for line in content]
-                content = [[elem.split(",") for elem in line] for line in content]
-                # Since the splits introduce unnecessary list layers into keywords, using some list comprehension to get rid of them
-                keys = [[elem[0] for elem in inner_content][0] for inner_content in content]
-                # Values are easy to fetch, just grab the latter data within and element
-                values = [elem[1] for elem in content]
-                # Zip makes keys and values into a tuple, that dict can make a dictionary from
-                profile = dict(zip(keys, values))
-
-                # Only update the profile if all 3 keywords can be found in the text file
-                required_keys = ["keywords", "locations", "searchDesc"]
-                for key in required_keys:
-                    if key not in profile.keys():
-                        raise ValueError
-                    else:
-                        DuunitoriScraper.profile = profile
-
-            except KeyError as e:
-                messagebox.showerror(title="KeyError", message=e)
-
-            except ValueError:
-                messagebox.showerror(title="Error", message="Incorrect search profile formatting")
+        files = filedialog.askopenfilenames(initialdir=path, title="Select search profiles",
+                                            filetypes=(("Search profiles", "*.toml *.json *.txt"),
+                                                       (".toml", "*.toml"), (".json", "*.json"), (".txt", "*.txt")))
+        if not files:
+            return
+        try:
+            # Every profile is checked before any of them is used, a file can have many profiles
+            DuunitoriScraper.profiles = loadProfileFiles(files)
 
-            except Exception as e:
-                messagebox.showerror(title="Error", message=e)
+        except ValueError as e:
+            messagebox.showerror(title="Error", message=e)
 
-            finally:
-                self.updateKeywordLabel()
-                self.updateLocationLabel()
+        except Exception as e:
+            messagebox.showerror(title="Error", message=e)
+
+        finally:
+            self.updateKeywordLabel()
+            self.updateLocationLabel()
 
     @staticmethod
     def openSettings():
@@ -221,139 +409,163 @@ class DuunitoriScraper(Tab):
         DuunitoriScraperSettings()
 
     def cancelSearch(self):
-        # TODO
         """
-        Cancel the search
+        Cancel the search, pending requests are dropped right away.
+        Start comes back in scrapeDone, once the running profiles have wound down.
         """
-        DuunitoriScraper.stop_scrape = True
-        self.showStartButton()
+        if self.__scheduler is not None:
+            self.__scheduler.cancel()
 
-    @staticmethod
-    def numOfPages():
-        """
-        Method to get the number of pages to scrape based on keywords etc.
-        Works by doing the initial search and locating the last page number from the bottom.
-        """
-        url = DuunitoriScraper.getUrl()
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, "html.parser")
-        page_counter = soup.find_all("a", class_="pagination__pagenum")
-        page_counter = page_counter[-1]
-        page_counter = str(page_counter)
-        # Non-pythonic combination to get the final page number from the html element
-        page_counter = page_counter.split("=")[-1].split('"')[0]
-        page_counter = int(page_counter)
-        return page_counter
+    def setOffline(self, offline):
+        """
+        Offline mode replays earlier responses from the cache without touching the network
+        """
+        DuunitoriScraper.settings["offline"] = offline
+        if self.__scraper is not None:
+            self.__scraper.setOffline(offline)
+
+    def setResume(self, resume):
+        """
+        Resumed searches continue from the checkpoint of an interrupted run instead of starting over
+        """
+        DuunitoriScraper.settings["resume"] = resume
+        if self.__scraper is not None:
+            self.__scraper.settings["resume"] = resume
 
     def startScrape(self):
         """
         Starts the scraping in another thread to allow windows to function relatively normally.
         """
-        DuunitoriScraper.stop_scrape = False
+        # Starting over resets the scraper, which would also clear the cancel of a run still winding down
+        if self.__worker is not None and self.__worker.running:
+            return
         self.showCancelButton()
-        self.__page_counter = self.numOfPages()
-        self.initProgressBar(maximum=self.__page_counter)
-        self.__scrapeThread = Thread(target=self.scrape)
-        self.__scrapeThread.start()
-
-    def scrape(self):
+        # Page counts come in with the progress events
+        self.__progress = {}
+        self.initProgressBar(maximum=1)
+        events = self.scheduler.events(DuunitoriScraper.profiles)
+        self.__worker = ScrapeWorker(self, events, self.handleEvents, self.scrapeDone,
+                                     interval=DuunitoriScraper.settings["refresh_interval"],
+                                     batch=DuunitoriScraper.settings["refresh_batch"])
+        self.__worker.start()
+
+    def handleEvents(self, events):
         """
-        Goes through the results one by one, opening them, and extracting data in the info cell.
-        eg. Location, business name, VatID, and field.
-        Updates all the found data into the treeview, and stores links.
-        Also updates the progress bar according to search page number.
+        Updates a batch of found jobs into the treeview. Progress events are coalesced,
+        the progress bar is only updated once per batch. Called in the Tk thread.
         """
-
-        for page_num in range(1, self.__page_counter + 1, 1):
-            if DuunitoriScraper.stop_scrape:
-                break
-            url = self.getUrl() + "&sivu=" + str(page_num)
-
-            site = requests.get(url)
-            soup = BeautifulSoup(site.content, "html.parser")
-            results = soup.findAll("a", class_="job-box__hover gtm-search-result")
-
-            for result in results:
-                if DuunitoriScraper.stop_scrape:
-                    break
-                time.sleep(0.1)
-                link = "https://duunitori.fi/" + result["href"]
-                page = requests.get(link)
-                page_soup = BeautifulSoup(page.content, "html.parser")
-                title = page_soup.find("h1", class_="header__title").string
-                info_cell = page_soup.find("div", class_="1/1 grid__cell info-listing")
-                if info_cell is not None:
-                    info_blocks = info_cell.findAll("div", class_="info-listing__block")
-
-                    location = employer = vatid = field = "-"
-
-                    for block in info_blocks:
-                        heading = block.find("h4", class_="info-listing__heading").string
-                        value_block = block.find("div", class_="info-listing__value")
-
-                        if heading == "Työpaikan sijainti":
-                            location = value_block.find("span").string
-                        if heading == "Toiminimi":
-                            employer = value_block.find("span").string
-                        if heading == "Y-tunnus":
-                            vatid = value_block.find("span").string
-                        if heading == "Toimiala":
-                            field = value_block.find("span").string
-
-                    self.__job_list.insert(parent="", index="end", iid=DuunitoriScraper.iid, text=title,
-                                           values=(location, employer, vatid, field, link))
-                    DuunitoriScraper.iid += 1
-
-            self.updateProgressBar(value=page_num)
+        progress = False
+        error = None
+        stats = self.scraper.stats
+        with stats.timer("ui_insert"):
+            for event in events:
+                if isinstance(event, Job):
+                    self.insertJob(event)
+                    if self.__exporter is not None:
+                        self.__exporter.write(event)
+                elif isinstance(event, Progress):
+                    self.__progress[event.profile] = (event.page, event.pages)
+                    progress = True
+                elif isinstance(event, Exception):
+                    error = event
+
+        if progress:
+            pages = sum(total for page, total in self.__progress.values())
+            self.__progressbar.configure(maximum=max(pages, 1))
+            self.updateProgressBar(value=sum(page for page, total in self.__progress.values()))
+        self.__statusVar.set(stats.summary())
+        if error is not None:
+            messagebox.showerror(title="Error", message=error)
+
+    def scrapeDone(self):
         self.showStartButton()
         self.showDoneLabel()
+        self.closeExport()
+        self.__statusVar.set(self.scraper.stats.summary())
+        # Jobs found during the scrape were added to the end, put them in their sorted places
+        if self.__sortColumn is not None:
+            self.renderResults()
 
-    @staticmethod
-    def getUrl():
+    def openStats(self):
         """
-        Method injects given keywords and locations into url query.
-        Also checks for "searchDesc".
+        Just a pass through
         """
-        url = "https://duunitori.fi/"
-        kw_list = DuunitoriScraper.profile["keywords"]
-        if len(kw_list) != 0:
-            url += "tyopaikat?haku=" + kw_list[0]
-            if len(kw_list) > 1:
-                for i in range(1, len(kw_list), 1):
-                    url += "%3B" + kw_list[i]
+        StatsWindow(self.scraper.stats)
 
-        loc_list = DuunitoriScraper.profile["locations"]
-        if len(loc_list) != 0:
-            url += "&alue=" + loc_list[0]
-            if len(loc_list) > 1:
-                for i in range(1, len(loc_list), 1):
-                    url += "%3B" + loc_list[i]
+    def insertJob(self, job):
+        """
+        Adds the job to the result store and the job list, its row in the store is its iid.
+        Jobs not matching the current filter are left detached.
+        """
+        row = self.__results.add(job)
+        self.__job_list.insert(parent="", index="end", iid=row, text=job.title,
+                               values=(job.location, job.employer, job.vatid, job.field, job.profile,
+                                       job.status or ""))
+        query = self.__filterVar.get()
+        if query and not self.__results.matches(row, query):
+            self.__job_list.detach(row)
+
+    def scheduleFilter(self, *args):
+        """
+        Filters the job list once typing in the filter box pauses
+        """
+        if self.__filterAfter is not None:
+            self.after_cancel(self.__filterAfter)
+        self.__filterAfter = self.after(DuunitoriScraper.settings["filter_delay"], self.renderResults)
+
+    def sortBy(self, column):
+        if self.__sortColumn == column:
+            self.__sortReverse = not self.__sortReverse
+        else:
+            self.__sortColumn = column
+            self.__sortReverse = False
+        self.renderResults()
+
+    def renderResults(self):
+        """
+        Shows the jobs matching the filter in the sorted order. The rows stay in the job list, the ones left out are
+        just detached, so the whole view is replaced with a single call instead of rebuilding the widget.
+        """
+        self.__filterAfter = None
+        rows = self.__results.view(self.__filterVar.get(), self.__sortColumn, self.__sortReverse)
+        self.__job_list.set_children("", *rows)
 
-        if DuunitoriScraper.profile["searchDesc"]:
-            url += "&search_also_descr=1"
+    def exportResults(self):
+        """
+        Exports the jobs shown in the job list to CSV, JSON Lines or Parquet, picked by the file extension.
+        If a scrape is running, the jobs it finds are streamed to the same file until it's done.
+        """
+        running = self.__worker is not None and self.__worker.running
+        exporter = self.exportRecords((self.__results[int(iid)] for iid in self.__job_list.get_children()),
+                                      keepOpen=running)
+        if running and exporter is not None:
+            self.__exporter = exporter
 
-        return url
+    def closeExport(self):
+        if self.__exporter is not None:
+            self.__exporter.close()
+            self.__exporter = None
 
     def openLink(self, event):
         """
         Uses the webbrowser module to open clicked link
         """
         # Select iid based on item clicked. "Item" means the entire row and event.x and event.y just specify coordinates.
-        iid = int((self.__job_list.identify("item", event.x, event.y)))
-        # Fetch the link from links column of the item based on iid
-        item = self.__job_list.item(iid)
-        url = item["values"][-1]
+        iid = self.__job_list.identify("item", event.x, event.y)
+        if not iid:
+            return
+        # Fetch the link from the result store based on iid
+        url = self.__results[int(iid)].link
 
         webbrowser.open(url)
 
     def updateKeywordLabel(self):
-        keywords = self.profile["keywords"]
-        kw_string = ", ".join(keywords)
+        # Profiles are separated with semicolons
+        kw_string = "; ".join(", ".join(profile["keywords"]) for profile in self.profiles)
         self.__keywordVar.set("Keywords: " + kw_string)
 
     def updateLocationLabel(self):
-        locations = self.profile["locations"]
-        loc_string = ", ".join(locations)
+        loc_string = "; ".join(", ".join(profile["locations"]) for profile in self.profiles)
         self.__locationVar.set("Locations: " + loc_string)
 
     def showStartButton(self):
@@ -366,8 +578,6 @@ class DuunitoriScraper(Tab):
 
     def updateProgressBar(self, value=0):
         self.__progressbar["value"] = value
-        self.update_idletasks()
-        self.__progressbar.update()
 
     def showDoneLabel(self):
         self.__progressbar.grid_forget()
@@ -438,28 +648,20 @@ class DuunitoriScraperSettings(tk.Toplevel):
         Make sure all settings are up to date and then save new config and destroy window
         """
         try:
-            # Comma is used as the separator
-            separator = ","
-            # Retrieves a list of words from keyword entry field
+            # Retrieves lists of words from keyword and location entry fields
             keywords = self.extractEntries(self.__keywordEntry)
-            # Join them back into a string together with key
-            keywords = "keywords=" + separator.join(keywords) + "\n"
-            # Same as above
             locations = self.extractEntries(self.__locationsEntry)
-            locations = "locations=" + separator.join(locations) + "\n"
-            # Save keys + and their boolean vars as a string
-            searchDesc = "searchDesc=" + str(self.__searchDescVar.get()) + "\n"
-
-            # All into one list for writeLines()
-            lines = [keywords, locations, searchDesc]
+            searchDesc = self.__searchDescVar.get()
         except Exception as e:  # Error is broad for now
             messagebox.showerror("Error", e)
 
         try:
             path = os.path.dirname(os.getcwd()) + "/search_profiles"
-            file = filedialog.asksaveasfile(mode="w", initialdir=path, title="Save profile", defaultextension=".txt")
+            file = filedialog.asksaveasfile(mode="w", initialdir=path, title="Save profile", defaultextension=".toml",
+                                            filetypes=((".toml", "*.toml"), (".json", "*.json"), (".txt", "*.txt")))
             if file:
-                file.writelines(lines)
+                # Format goes by the extension picked
+                file.write(formatProfile(keywords, locations, searchDesc, profileFormat(file.name)))
                 file.close()
         except Exception as e:  # Error is broad for now
             messagebox.showerror("Error", e)
@@ -481,34 +683,472 @@ class DuunitoriScraperSettings(tk.Toplevel):
         return entries
 
 
+class SiteTab(Tab):
+    """
+    Generic results tab for a site plugin (see engine.py): a search box, start and cancel buttons, a progress bar
+    and a list of the found records with the plugin's columns. Crawls run on the shared engine.
+    """
+
+    def __init__(self, target, plugin, engine):
+        super().__init__(target, plugin.title)
+        self.plugin = plugin
+        self.engine = engine
+        self.__crawl = None
+        self.__worker = None
+        # Found records, their index is their iid in the record list
+        self.__records = []
+
+    def build(self):
+        padding = App.settings["padding"]
+        plugin = self.plugin
+
+        # Search box and buttons on top
+        self.__searchFrame = tk.Frame(self)
+        self.__searchFrame.pack(fill="x", padx=padding, pady=padding)
+        tk.Label(self.__searchFrame, text=plugin.query_label + ":").pack(side="left")
+        self.__queryVar = tk.StringVar()
+        self.__queryEntry = tk.Entry(self.__searchFrame, textvariable=self.__queryVar)
+        self.__queryEntry.pack(side="left", expand=True, fill="x")
+        self.__queryEntry.bind("<Return>", lambda event: self.startCrawl())
+        self.__exportButton = tk.Button(self.__searchFrame, text="Export", command=self.exportResults)
+        self.__exportButton.pack(side="right")
+        self.__cancelButton = tk.Button(self.__searchFrame, text="Cancel", command=self.cancelCrawl)
+        self.__startButton = tk.Button(self.__searchFrame, text="Start", command=self.startCrawl)
+        self.__startButton.pack(side="right")
+
+        # Record list with the plugin's columns, the first one is the tree column
+        self.__resultFrame = tk.Frame(self)
+        self.__resultFrame.pack(expand=True, fill="both")
+        self.__record_list = ttk.Treeview(self.__resultFrame)
+        self.__record_list["columns"] = plugin.keys()[1:]
+        self.__record_list.column("#0", anchor="w", width=300, minwidth=20)
+        self.__record_list.heading("#0", text=plugin.columns[0][1], anchor="w")
+        for key, heading in plugin.columns[1:]:
+            self.__record_list.column(key, anchor="w", width=120)
+            self.__record_list.heading(key, text=heading, anchor="w")
+        self.__scrollbar = ttk.Scrollbar(self.__resultFrame, command=self.__record_list.yview)
+        self.__record_list.configure(yscrollcommand=self.__scrollbar.set)
+        self.__scrollbar.pack(side="right", fill="y")
+        self.__record_list.pack(expand=True, fill="both")
+        self.__record_list.bind("<Double-Button-1>", self.openLink)
+
+        self.__progressbar = ttk.Progressbar(self, orient="horizontal", mode="determinate")
+        self.__progressbar.pack(fill="x", padx=padding)
+        self.__statusVar = tk.StringVar()
+        tk.Label(self, textvariable=self.__statusVar, anchor="w").pack(fill="x", padx=padding)
+
+    def startCrawl(self):
+        if self.__worker is not None and self.__worker.running:
+            return
+        self.__record_list.delete(*self.__record_list.get_children())
+        self.__records = []
+        self.__progressbar.configure(maximum=1, value=0)
+        self.__startButton.pack_forget()
+        self.__cancelButton.pack(side="right")
+        self.__crawl = self.engine.crawl(self.plugin, self.__queryVar.get())
+        self.__worker = ScrapeWorker(self, self.__crawl.events(), self.handleEvents, self.crawlDone,
+                                     interval=DuunitoriScraper.settings["refresh_interval"],
+                                     batch=DuunitoriScraper.settings["refresh_batch"])
+        self.__worker.start()
+
+    def cancelCrawl(self):
+        if self.__crawl is not None:
+            self.__crawl.cancel()
+
+    def handleEvents(self, events):
+        """
+        Inserts a batch of found records, called in the Tk thread
+        """
+        error = None
+        with self.engine.stats.timer(self.plugin.name + "_ui_insert"):
+            for event in events:
+                if isinstance(event, dict):
+                    self.insertRecord(event)
+                elif isinstance(event, Progress):
+                    self.__progressbar.configure(maximum=max(event.pages, 1), value=event.page)
+                elif isinstance(event, Exception):
+                    error = event
+        self.__statusVar.set("%d results" % len(self.__records))
+        if error is not None:
+            messagebox.showerror(title="Error", message=error)
+
+    def crawlDone(self):
+        self.__cancelButton.pack_forget()
+        self.__startButton.pack(side="right")
+        failed = self.__crawl.failed if self.__crawl is not None else 0
+        self.__statusVar.set("%d results, done" % len(self.__records)
+                             + (", %d pages failed" % failed if failed else ""))
+
+    def insertRecord(self, record):
+        keys = self.plugin.keys()
+        self.__record_list.insert(parent="", index="end", iid=len(self.__records), text=record.get(keys[0]) or "",
+                                  values=tuple("" if record.get(key) is None else record.get(key)
+                                               for key in keys[1:]))
+        self.__records.append(record)
+
+    def openLink(self, event):
+        iid = self.__record_list.identify("item", event.x, event.y)
+        if not iid:
+            return
+        url = self.__records[int(iid)].get(self.plugin.link)
+        if url:
+            webbrowser.open(url)
+
+    def exportResults(self):
+        """
+        Exports the found records to CSV, JSON Lines or Parquet, picked by the file extension
+        """
+        self.exportRecords(self.__records, self.plugin.keys(), self.plugin.types)
+
+
 class AlkoScraper(Tab):
-    # TODO Implement
     """
-    Alko price/alcohol calculator tab
+    Alko price/alcohol calculator tab. The whole price list is downloaded at once and kept in a columnar store,
+    the list shows the top products by the picked column, eg. the cheapest alcohol per gram.
     """
 
-    def __init__(self, target):
+    # Latest ingested price list is kept in store between runs, the list shows top_n products at a time
+    settings = {"store": os.path.dirname(os.getcwd()) + "/cache/alko.sqlite",
+                "top_n": 200,
+                }
+    # Sort choices and the columns they sort by
+    SORTS = {"€ / g alcohol": "eur_per_gram",
+             "Price": "price",
+             "€ / l": "litre_price",
+             "Alcohol %": "abv",
+             "Size": "size",
+             "Name": "name",
+             }
+    FORMATS = {"size": "%.2f", "price": "%.2f", "litre_price": "%.2f", "abv": "%.1f", "eur_per_gram": "%.3f"}
+
+    def __init__(self, target, engine):
         super().__init__(target, "Alko")
+        self.plugin = AlkoPlugin()
+        self.engine = engine
+        self.__worker = None
+
+    def build(self):
+        """
+        Loads the stored price list along with the widgets
+        """
+        padding = App.settings["padding"]
+        self.__store = PriceStore(AlkoScraper.settings["store"])
+        self.__prices = PriceList()
+        self.__prices.ingest(self.__store.products())
+
+        # Filters on top
+        self.__filterFrame = tk.Frame(self)
+        self.__filterFrame.pack(fill="x", padx=padding, pady=padding)
+        tk.Label(self.__filterFrame, text="Name:").pack(side="left")
+        self.__nameVar = tk.StringVar()
+        self.__nameVar.trace_add("write", lambda *args: self.renderResults())
+        tk.Entry(self.__filterFrame, textvariable=self.__nameVar).pack(side="left", expand=True, fill="x")
+        tk.Label(self.__filterFrame, text="Type:").pack(side="left")
+        self.__typeVar = tk.StringVar(value="All")
+        self.__typeBox = ttk.Combobox(self.__filterFrame, textvariable=self.__typeVar, state="readonly", width=20)
+        self.__typeBox.bind("<<ComboboxSelected>>", lambda event: self.renderResults())
+        self.__typeBox.pack(side="left")
+        tk.Label(self.__filterFrame, text="Sort by:").pack(side="left")
+        self.__sortVar = tk.StringVar(value="€ / g alcohol")
+        self.__sortBox = ttk.Combobox(self.__filterFrame, textvariable=self.__sortVar, state="readonly", width=14,
+                                      values=tuple(AlkoScraper.SORTS))
+        self.__sortBox.bind("<<ComboboxSelected>>", lambda event: self.renderResults())
+        self.__sortBox.pack(side="left")
+        self.__reverseVar = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.__filterFrame, text="Descending", variable=self.__reverseVar,
+                       command=self.renderResults).pack(side="left")
+
+        # Product list
+        self.__resultFrame = tk.Frame(self)
+        self.__resultFrame.pack(expand=True, fill="both")
+        self.__product_list = ttk.Treeview(self.__resultFrame)
+        self.__product_list["columns"] = self.plugin.keys()[1:]
+        self.__product_list.column("#0", anchor="w", width=250, minwidth=20)
+        self.__product_list.heading("#0", text=self.plugin.columns[0][1], anchor="w")
+        for key, heading in self.plugin.columns[1:]:
+            self.__product_list.column(key, anchor="e" if key in AlkoScraper.FORMATS else "w", width=90)
+            self.__product_list.heading(key, text=heading, anchor="w")
+        self.__scrollbar = ttk.Scrollbar(self.__resultFrame, command=self.__product_list.yview)
+        self.__product_list.configure(yscrollcommand=self.__scrollbar.set)
+        self.__scrollbar.pack(side="right", fill="y")
+        self.__product_list.pack(expand=True, fill="both")
+        self.__product_list.bind("<Double-Button-1>", self.openLink)
+
+        self.__statusVar = tk.StringVar()
+        tk.Label(self, textvariable=self.__statusVar, anchor="w").pack(fill="x", padx=padding)
+
+        self.updateTypes()
+        self.renderResults()
+
+    def download(self):
+        """
+        Downloads the price list through the engine and ingests it in a worker thread
+        """
+        self.__ingest(self.__downloaded(self.engine.crawl(self.plugin).events()))
+
+    def openFile(self):
+        """
+        Ingests a price list file saved earlier
+        """
+        filename = filedialog.askopenfilename(title="Open price list", filetypes=(("Excel", "*.xlsx"),))
+        if filename:
+            self.__ingest([readProducts(filename)])
+
+    def __ingest(self, sources):
+        if self.__worker is not None and self.__worker.running:
+            return
+        self.__statusVar.set("Loading the price list...")
+        self.__worker = ScrapeWorker(self, self.__stored(sources), self.handleEvents)
+        self.__worker.start()
+
+    @staticmethod
+    def __downloaded(events):
+        """
+        Collects the products of a crawl, run in the worker thread.
+        A crawl without products means the download failed, that's raised so the error gets shown.
+        """
+        products = []
+        for event in events:
+            if isinstance(event, dict):
+                products.append(event)
+            elif isinstance(event, Finished):
+                if not products:
+                    raise OSError("Downloading the price list failed" if event.completed
+                                  else "Downloading the price list was cancelled")
+                yield products
+
+    def __stored(self, sources):
+        """
+        Writes the changed products to the store in the worker thread, and passes the product lists on
+        """
+        for products in sources:
+            products = list(products)
+            self.__store.ingest(products)
+            yield products
+
+    def handleEvents(self, events):
+        """
+        Brings the price list up to date with the ingested products, only the changed rows are touched
+        """
+        for event in events:
+            if isinstance(event, Exception):
+                self.__statusVar.set("")
+                messagebox.showerror(title="Error", message=event)
+                return
+            added, changed, removed = self.__prices.ingest(event)
+            self.updateTypes()
+            self.renderResults()
+            self.__statusVar.set("%d products, %d new, %d changed, %d removed"
+                                 % (len(self.__prices), added, changed, removed))
+
+    def updateTypes(self):
+        self.__typeBox.configure(values=("All",) + tuple(self.__prices.types()))
+
+    def renderResults(self):
+        """
+        Shows the top products, the sorted indexes make this quick enough to run on every key press
+        """
+        product_type = self.__typeVar.get()
+        products = self.__prices.top(AlkoScraper.settings["top_n"], by=AlkoScraper.SORTS[self.__sortVar.get()],
+                                     reverse=self.__reverseVar.get(),
+                                     type=None if product_type == "All" else product_type,
+                                     query=self.__nameVar.get())
+        self.__product_list.delete(*self.__product_list.get_children())
+        keys = self.plugin.keys()
+        for product in products:
+            values = []
+            for key in keys[1:]:
+                value = product[key]
+                if value is None:
+                    value = ""
+                elif key in AlkoScraper.FORMATS:
+                    value = AlkoScraper.FORMATS[key] % value
+                values.append(value)
+            self.__product_list.insert(parent="", index="end", iid=product["number"], text=product["name"] or "",
+                                       values=values)
+        if not self.__worker or not self.__worker.running:
+            self.__statusVar.set("%d products" % len(self.__prices))
+
+    def openLink(self, event):
+        number = self.__product_list.identify("item", event.x, event.y)
+        if number:
+            webbrowser.open(PRODUCT_URL % number)
+
+    def exportResults(self):
+        """
+        Exports the whole price list with euros per gram of alcohol to CSV, JSON Lines or Parquet
+        """
+        self.exportRecords(self.__prices.products(), self.plugin.keys(), self.plugin.types, "Export products")
 
 
 class ToriScraper(Tab):
-    # TODO Implement
     """
-    Tori.fi scraper for finding the best deals on stools?
+    Tori.fi deal watcher. Saved searches are polled every few minutes while watching, new listings and price drops
+    show up on top of the list, see tori.py.
     """
 
-    def __init__(self, target):
+    def __init__(self, target, engine):
         super().__init__(target, "Tori.fi")
+        self.plugin = ToriPlugin()
+        self.engine = engine
+        self.__worker = None
+        # Shown listings, their index is their iid in the list
+        self.__records = []
+
+    def build(self):
+        padding = App.settings["padding"]
+        self.__watcher = Watcher.fromSettings(self.engine)
+
+        # Saved searches on the left
+        self.__searchFrame = tk.Frame(self)
+        self.__searchFrame.pack(side="left", fill="y", padx=padding, pady=padding)
+        self.__searchVar = tk.StringVar()
+        self.__searchEntry = tk.Entry(self.__searchFrame, textvariable=self.__searchVar)
+        self.__searchEntry.pack(fill="x")
+        self.__searchEntry.bind("<Return>", lambda event: self.addSearch())
+        tk.Button(self.__searchFrame, text="Add search", command=self.addSearch).pack(fill="x")
+        self.__searchList = tk.Listbox(self.__searchFrame, width=25)
+        self.__searchList.pack(expand=True, fill="y")
+        tk.Button(self.__searchFrame, text="Remove search", command=self.removeSearch).pack(fill="x")
+        self.__watchButton = tk.Button(self.__searchFrame, text="Start watching", command=self.startWatching)
+        self.__watchButton.pack(fill="x")
+        self.__stopButton = tk.Button(self.__searchFrame, text="Stop watching", command=self.stopWatching)
+
+        # New and changed listings, newest on top
+        self.__resultFrame = tk.Frame(self)
+        self.__resultFrame.pack(expand=True, fill="both")
+        self.__listing_list = ttk.Treeview(self.__resultFrame)
+        self.__listing_list["columns"] = self.plugin.keys()[1:]
+        self.__listing_list.column("#0", anchor="w", width=250, minwidth=20)
+        self.__listing_list.heading("#0", text=self.plugin.columns[0][1], anchor="w")
+        for key, heading in self.plugin.columns[1:]:
+            self.__listing_list.column(key, anchor="w", width=90)
+            self.__listing_list.heading(key, text=heading, anchor="w")
+        self.__listing_list.tag_configure("drop", background="#d8f5d0")
+        self.__scrollbar = ttk.Scrollbar(self.__resultFrame, command=self.__listing_list.yview)
+        self.__listing_list.configure(yscrollcommand=self.__scrollbar.set)
+        self.__scrollbar.pack(side="right", fill="y")
+        self.__listing_list.pack(expand=True, fill="both")
+        self.__listing_list.bind("<Double-Button-1>", self.openLink)
+
+        self.__statusVar = tk.StringVar()
+        tk.Label(self, textvariable=self.__statusVar, anchor="w").pack(fill="x", padx=padding)
+        self.refreshSearches()
+
+    def refreshSearches(self):
+        self.__searchList.delete(0, "end")
+        for search, last_poll in self.__watcher.store.searches():
+            self.__searchList.insert("end", search)
+
+    def addSearch(self):
+        search = self.__searchVar.get().strip()
+        if search:
+            self.__watcher.store.addSearch(search)
+            self.__searchVar.set("")
+            self.refreshSearches()
+
+    def removeSearch(self):
+        for index in self.__searchList.curselection():
+            self.__watcher.store.removeSearch(self.__searchList.get(index))
+        self.refreshSearches()
+
+    def startWatching(self):
+        if self.__worker is not None and self.__worker.running:
+            return
+        self.__watchButton.pack_forget()
+        self.__stopButton.pack(fill="x")
+        self.__statusVar.set("Watching...")
+        self.__worker = ScrapeWorker(self, self.__watcher.events(), self.handleEvents, self.watchingDone,
+                                     interval=DuunitoriScraper.settings["refresh_interval"],
+                                     batch=DuunitoriScraper.settings["refresh_batch"])
+        self.__worker.start()
+
+    def stopWatching(self):
+        self.__watcher.cancel()
+
+    def watchingDone(self):
+        self.__stopButton.pack_forget()
+        self.__watchButton.pack(fill="x")
+        self.__statusVar.set("Stopped watching")
+
+    def handleEvents(self, events):
+        """
+        Shows the new and changed listings of the polls, a price drop rings the bell
+        """
+        drops = False
+        for event in events:
+            if isinstance(event, dict):
+                self.insertRecord(event)
+                drops = drops or event["event"] == "drop"
+            elif isinstance(event, Polled) and event.error is not None:
+                self.__statusVar.set("%s: searching \"%s\" failed: %s" % (time.strftime("%H:%M"), event.search,
+                                                                           event.error))
+            elif isinstance(event, Polled):
+                self.__statusVar.set("%s: searched \"%s\", %d new, %d price drops%s"
+                                     % (time.strftime("%H:%M"), event.search, event.new, event.drops,
+                                        ", %d pages failed" % event.failed if event.failed else ""))
+            elif isinstance(event, Exception):
+                self.__statusVar.set("%s: %s" % (time.strftime("%H:%M"), event))
+        if drops:
+            self.bell()
+
+    def insertRecord(self, record):
+        keys = self.plugin.keys()
+        self.__listing_list.insert(parent="", index=0, iid=len(self.__records), text=record.get(keys[0]) or "",
+                                   values=tuple("" if record.get(key) is None else record.get(key)
+                                                for key in keys[1:]),
+                                   tags=(record["event"],))
+        self.__records.append(record)
+
+    def openLink(self, event):
+        iid = self.__listing_list.identify("item", event.x, event.y)
+        if iid:
+            webbrowser.open(self.__records[int(iid)]["link"])
+
+    def exportResults(self):
+        """
+        Exports the shown listings to CSV, JSON Lines or Parquet
+        """
+        self.exportRecords(self.__records, self.plugin.keys(), self.plugin.types, "Export listings")
 
 
-class RedditScraper(Tab):
-    # TODO Implement
+class RedditScraper(SiteTab):
     """
-    Reddit scraper??
+    Newest posts of the given subreddits
     """
 
-    def __init__(self, target):
-        super().__init__(target, "Reddit")
+    def __init__(self, target, engine):
+        super().__init__(target, RedditPlugin(), engine)
+
+
+class StatsWindow(tk.Toplevel):
+    """
+    Shows the counters and per-stage timings of the latest scrape, see stats.py for the stages
+    """
+
+    def __init__(self, stats):
+        super().__init__()
+        self.__stats = stats
+        padding = App.settings["padding"]
+
+        self.wm_title("Scraper statistics")
+        self.wm_iconbitmap(App.icon_path)
+
+        self.__text = tk.Text(self, width=70, height=30)
+        self.__text.pack(expand=True, fill="both", padx=padding, pady=padding)
+
+        self.__refreshButton = tk.Button(self, text="Refresh", command=self.refresh)
+        self.__refreshButton.pack(side="left", padx=padding, pady=padding)
+        self.__closeButton = tk.Button(self, text="Close", command=self.destroy)
+        self.__closeButton.pack(side="right", padx=padding, pady=padding)
+
+        self.refresh()
+
+    def refresh(self):
+        self.__text.configure(state="normal")
+        self.__text.delete("1.0", "end")
+        self.__text.insert("end", json.dumps(self.__stats.snapshot(), indent=2))
+        self.__text.configure(state="disabled")
 
 
 class Help(tk.Toplevel):
@@ -534,6 +1174,7 @@ class Help(tk.Toplevel):
                                      "To open an existing search profile:\n" \
                                      "1. Go to File -> Duunitori scraper -> Open search profile\n" \
                                      "2. Select the text file containing your search profile\n" \
+                                     "(Select several to scrape them all at the same time)\n" \
                                      "3. Click Open\n" \
                                      "\n" \
                                      "After opening a search profile, your keywords and locations should" \
@@ -545,10 +1186,14 @@ class Help(tk.Toplevel):
                                      "\n" \
                                      "You can click any result to open it in your default browser\n" \
                                      "\n" \
+                                     "Type in the filter box to show only matching results, eg.\n" \
+                                     "python location:helsinki field:it status:new\n" \
+                                     "Click a column heading to sort by it, click again to reverse\n" \
+                                     "\n" \
                                      "To cancel a search, press cancel"
         self.__duunitori_help_label = tk.Label(self.__DuunitoriHelpFrame, text=self.__duunitori_help_text)
         self.__duunitori_help_label.pack(anchor="nw")
 
 
 if __name__ == "__main__":
-    app = App()
+    App().mainloop()
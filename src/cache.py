@@ -0,0 +1,202 @@
+"""
+Persistent on-disk HTTP response cache, stored in SQLite and keyed by URL.
+
+Fresh entries (younger than their TTL) are served without touching the network.
+Stale entries are revalidated with If-None-Match / If-Modified-Since, so an unchanged page costs a 304 instead of
+a full download. The cache is size bounded, least recently used entries get evicted first.
+Offline mode serves everything from the cache regardless of age, which makes reruns and parser testing possible
+without hitting the site at all.
+"""
+
+from threading import Lock
+import json
+import time
+import requests
+from database import openDatabase
+
+DAY = 24 * 60 * 60
+# Default of CachedSession.get's entry, the url is looked up there
+_LOOKUP = object()
+
+
+class OfflineMiss(requests.ConnectionError):
+    """
+    Raised in offline mode when the url isn't in the cache
+    """
+
+
+class CachedResponse:
+    """
+    Minimal stand-in for requests.Response for responses served from the cache
+    """
+
+    from_cache = True
+
+    def __init__(self, url, content, headers, status_code=200):
+        self.url = url
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.status_code = status_code
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+
+class ResponseCache:
+    """
+    SQLite backed storage for responses.
+    path -- SQLite database file, see openDatabase
+    max_bytes -- upper bound for the stored bodies, least recently used entries are evicted above it
+    """
+
+    def __init__(self, path, max_bytes=200 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.__lock = Lock()
+        self.__db = openDatabase(path)
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                 url TEXT PRIMARY KEY,
+                                 content BLOB NOT NULL,
+                                 headers TEXT NOT NULL,
+                                 etag TEXT,
+                                 last_modified TEXT,
+                                 stored REAL NOT NULL,
+                                 last_access REAL NOT NULL,
+                                 size INTEGER NOT NULL)""")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.__db.commit()
+        self.__total = self.__db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def lookup(self, url):
+        """
+        Returns (response, age in seconds, etag, last_modified) or None if the url isn't cached.
+        Only reads, an entry that gets used is marked with touch().
+        """
+        with self.__lock:
+            row = self.__db.execute("SELECT content, headers, etag, last_modified, stored FROM responses "
+                                    "WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        content, headers, etag, last_modified, stored = row
+        return CachedResponse(url, content, json.loads(headers)), time.time() - stored, etag, last_modified
+
+    def store(self, url, response):
+        content = response.content
+        headers = {key: value for key, value in response.headers.items()
+                   if key.lower() in ("content-type", "etag", "last-modified")}
+        now = time.time()
+        with self.__lock:
+            old = self.__db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if old is not None:
+                self.__total -= old[0]
+            self.__db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (url, content, json.dumps(headers), response.headers.get("ETag"),
+                               response.headers.get("Last-Modified"), now, now, len(content)))
+            self.__total += len(content)
+            self.__evict()
+            self.__db.commit()
+
+    def touch(self, url):
+        """
+        Marks a cached entry as used, for the least recently used eviction
+        """
+        with self.__lock:
+            self.__db.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+            self.__db.commit()
+
+    def refresh(self, url):
+        """
+        Marks a cached entry as fresh again after a 304
+        """
+        now = time.time()
+        with self.__lock:
+            self.__db.execute("UPDATE responses SET stored = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self.__db.commit()
+
+    def clear(self):
+        with self.__lock:
+            self.__db.execute("DELETE FROM responses")
+            self.__db.commit()
+            self.__total = 0
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+    def __evict(self):
+        """
+        Drop least recently used entries until the cache fits into max_bytes. Lock must be held.
+        """
+        while self.__total > self.max_bytes:
+            rows = self.__db.execute("SELECT url, size FROM responses ORDER BY last_access LIMIT 50").fetchall()
+            if not rows:
+                self.__total = 0
+                return
+            for url, size in rows:
+                self.__db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.__total -= size
+                if self.__total <= self.max_bytes:
+                    return
+
+
+class CachedSession:
+    """
+    Wraps a session so GET requests go through the response cache.
+    ttl -- default time in seconds a cached response is used without revalidating
+    offline -- serve only from the cache, never touch the network
+    """
+
+    def __init__(self, session, cache, ttl=DAY, offline=False):
+        self.session = session
+        self.cache = cache
+        self.ttl = ttl
+        self.offline = offline
+
+    def cached(self, url, ttl=None):
+        """
+        Returns (response, entry): the cached response if it can be used without touching the network, otherwise
+        None, and the cache entry of url to pass on to get(), so a miss isn't looked up again.
+        Lets the fetcher skip rate limiting for cache hits.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        entry = self.cache.lookup(url)
+        if entry is not None and (self.offline or entry[1] < ttl):
+            self.cache.touch(url)
+            return entry[0], entry
+        return None, entry
+
+    def get(self, url, ttl=None, entry=_LOOKUP, **kwargs):
+        """
+        entry -- cache entry of url from cached(), looked up here if not given
+        """
+        ttl = self.ttl if ttl is None else ttl
+        cached = self.cache.lookup(url) if entry is _LOOKUP else entry
+
+        if self.offline:
+            if cached is None:
+                raise OfflineMiss(url)
+            self.cache.touch(url)
+            return cached[0]
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached is not None:
+            response, age, etag, last_modified = cached
+            if age < ttl:
+                self.cache.touch(url)
+                return response
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        fresh = self.session.get(url, headers=headers, **kwargs)
+        if fresh.status_code == 304 and cached is not None:
+            self.cache.refresh(url)
+            return cached[0]
+        if fresh.status_code == 200:
+            self.cache.store(url, fresh)
+        return fresh
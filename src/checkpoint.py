@@ -0,0 +1,120 @@
+"""
+Checkpoints of running scrapes, stored in SQLite, so an interrupted run can be resumed instead of started over.
+
+Every search has one checkpoint, keyed by its search url like the sightings in the seen store. It holds the start
+time of the run, the page count, the number of listing pages finished in a row from the first one, and every job
+collected so far with its page and position. A resumed run replays the jobs of the finished pages, reuses the jobs
+already collected from the pages after them and continues from the first unfinished page.
+The checkpoint is dropped once the run completes.
+"""
+
+from threading import Lock
+from database import openDatabase
+
+FIELDS = ("title", "location", "employer", "vatid", "field", "link", "first_seen", "last_seen")
+
+
+class Checkpoint:
+    """
+    State of an interrupted run, as loaded by Checkpoints.load
+    started -- start time of the interrupted run
+    pages -- page count of the search at the time
+    done -- listing pages finished, 1 to done are complete
+    finished -- job dictionaries of the finished pages by page number, in the order they were listed
+    collected -- job dictionaries from the unfinished pages, by link
+    """
+
+    __slots__ = ("started", "pages", "done", "finished", "collected")
+
+    def __init__(self, started, pages, done, finished, collected):
+        self.started = started
+        self.pages = pages
+        self.done = done
+        self.finished = finished
+        self.collected = collected
+
+
+class Checkpoints:
+    """
+    path -- SQLite database file, see openDatabase
+    """
+
+    def __init__(self, path):
+        self.__lock = Lock()
+        self.__db = openDatabase(path)
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS runs (
+                                 search TEXT PRIMARY KEY,
+                                 started REAL NOT NULL,
+                                 pages INTEGER NOT NULL DEFAULT 1,
+                                 done INTEGER NOT NULL DEFAULT 0)""")
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS records (
+                                 search TEXT NOT NULL,
+                                 link TEXT NOT NULL,
+                                 page INTEGER NOT NULL,
+                                 position INTEGER NOT NULL,
+                                 title TEXT, location TEXT, employer TEXT, vatid TEXT, field TEXT,
+                                 first_seen REAL, last_seen REAL,
+                                 PRIMARY KEY (search, link))""")
+        self.__db.commit()
+
+    def load(self, search):
+        """
+        Returns the Checkpoint of an interrupted run of search, or None if there isn't one
+        """
+        with self.__lock:
+            run = self.__db.execute("SELECT started, pages, done FROM runs WHERE search = ?", (search,)).fetchone()
+            if run is None:
+                return None
+            rows = self.__db.execute("SELECT page, title, location, employer, vatid, field, link, first_seen, "
+                                     "last_seen FROM records WHERE search = ? ORDER BY page, position",
+                                     (search,)).fetchall()
+        started, pages, done = run
+        finished = {}
+        collected = {}
+        for row in rows:
+            job = dict(zip(FIELDS, row[1:]))
+            if row[0] <= done:
+                finished.setdefault(row[0], []).append(job)
+            else:
+                collected[job["link"]] = job
+        return Checkpoint(started, pages, done, finished, collected)
+
+    def begin(self, search, started):
+        """
+        Starts a new checkpoint for search, dropping an earlier one
+        """
+        with self.__lock:
+            self.__db.execute("DELETE FROM records WHERE search = ?", (search,))
+            self.__db.execute("INSERT OR REPLACE INTO runs (search, started) VALUES (?, ?)", (search, started))
+            self.__db.commit()
+
+    def record(self, search, page, position, job):
+        """
+        Saves a collected job, position is its place on the listing page
+        """
+        with self.__lock:
+            self.__db.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (search, job["link"], page, position, job["title"], job["location"], job["employer"],
+                               job["vatid"], job["field"], job.get("first_seen"), job.get("last_seen")))
+            self.__db.commit()
+
+    def pageDone(self, search, done, pages):
+        """
+        Marks listing pages up to done as finished
+        """
+        with self.__lock:
+            self.__db.execute("UPDATE runs SET done = ?, pages = ? WHERE search = ?", (done, pages, search))
+            self.__db.commit()
+
+    def finish(self, search):
+        """
+        Drops the checkpoint of a completed run
+        """
+        with self.__lock:
+            self.__db.execute("DELETE FROM records WHERE search = ?", (search,))
+            self.__db.execute("DELETE FROM runs WHERE search = ?", (search,))
+            self.__db.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
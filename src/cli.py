@@ -0,0 +1,142 @@
+"""
+Headless command line runner for Duunitori search profiles.
+
+Runs the same scraper as the desktop app without importing tkinter, so it can be used from cron or on a server.
+All the given profiles run in one process at the same time, sharing the HTTP connections, the response cache,
+the seen store and one global request rate budget.
+
+Usage:
+python cli.py profiles.toml [profile2.json old.txt ...] [-o results.csv] [--format csv] [--offline]
+              [--workers 8] [--rate 5] [--parallel 4] [--parse-processes 4] [--resume] [--new-only]
+              [--stats stats.json] [--profile run.prof]
+Profile files can have many profiles each, see profiles.py for the format.
+Results are streamed to the output while the scrape runs, the format is guessed from the output file extension.
+Progress is checkpointed as the run goes, --resume continues interrupted runs from where they stopped.
+Jobs found by several profiles or reposted under a new link are written once, see --keep-duplicates.
+Exits with 1 if any of the profiles failed, eg. its first listing page couldn't be fetched.
+"""
+
+import argparse
+import sys
+from duunitori import Scraper, Job, Finished, SETTINGS
+from profiles import loadProfileFiles
+from exporters import EXPORTERS, openExporter
+from scheduler import Scheduler
+from stats import profiled
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape Duunitori job listings for search profiles.")
+    parser.add_argument("profiles", nargs="+", help="search profile files, .toml, .json or old style .txt")
+    parser.add_argument("-o", "--output", help="file to write the results to, defaults to stdout")
+    parser.add_argument("-f", "--format", choices=sorted(EXPORTERS),
+                        help="output format, defaults to the output file extension or tsv for stdout")
+    parser.add_argument("--workers", type=int, default=SETTINGS["workers"], help="concurrent requests")
+    parser.add_argument("--rate", type=float, default=SETTINGS["rate"], help="maximum requests per second")
+    parser.add_argument("--base-url", default=SETTINGS["base_url"],
+                        help="site to scrape, for pointing the scraper to a stand-in server")
+    parser.add_argument("--parallel", type=int, default=4, help="profiles scraped at the same time")
+    parser.add_argument("--parse-processes", type=int, default=SETTINGS["parse_processes"],
+                        help="worker processes for parsing detail pages, 0 parses them in the scraping threads")
+    parser.add_argument("--offline", action="store_true", help="only use pages from the response cache")
+    parser.add_argument("--no-cache", action="store_true", help="don't use the response cache")
+    parser.add_argument("--no-seen", action="store_true",
+                        help="fetch every detail page, even for jobs seen in earlier runs")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="write every hit, also jobs found already by link or by VatID and title")
+    parser.add_argument("--new-only", action="store_true",
+                        help="only write jobs that are new since the last run, reposts of earlier ads are left out")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue interrupted runs of the profiles from their checkpoints")
+    parser.add_argument("--no-checkpoints", action="store_true", help="don't save checkpoints for resuming")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="write request counters and per-stage timings as JSON at the end, - for stderr")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and save the stats to FILE, profiles are then scraped one at a time "
+                             "in the main thread so the parsing shows up in the profile")
+    return parser.parse_args(argv)
+
+
+def handleEvents(events, exporter, new_only=False):
+    """
+    Writes the jobs of the events to exporter, returns the number of profiles that failed or didn't finish
+    """
+    failed = 0
+    try:
+        for event in events:
+            if isinstance(event, Job):
+                if not new_only or event.status == "new":
+                    exporter.write(event)
+            elif isinstance(event, Finished):
+                print("Finished " + event.profile if event.completed else "Cancelled " + event.profile,
+                      file=sys.stderr)
+                failed += not event.completed
+            elif isinstance(event, Exception):
+                print("Error: " + str(event), file=sys.stderr)
+                failed += 1
+    except Exception as e:
+        # A single profile run outside the scheduler raises its error
+        print("Error: " + str(e), file=sys.stderr)
+        failed += 1
+    return failed
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    settings = {"base_url": args.base_url,
+                "workers": args.workers,
+                "rate": args.rate,
+                "offline": args.offline,
+                "resume": args.resume,
+                "dedupe": not args.keep_duplicates,
+                "parse_processes": args.parse_processes,
+                }
+    if args.no_cache:
+        settings["cache"] = None
+    if args.no_seen:
+        settings["seen"] = None
+    if args.no_checkpoints:
+        settings["checkpoints"] = None
+
+    try:
+        profiles = loadProfileFiles(args.profiles)
+    except (OSError, ValueError) as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 2
+
+    try:
+        if args.output:
+            exporter = openExporter(args.output, args.format)
+        elif args.format == "parquet":
+            raise ValueError("Parquet can't be written to stdout, give an output file")
+        else:
+            exporter = openExporter(sys.stdout, args.format or "tsv")
+    except (OSError, ValueError, ImportError) as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 2
+
+    scraper = Scraper.fromSettings(settings)
+    scheduler = Scheduler(scraper, parallel=args.parallel)
+    failed = 0
+    try:
+        if args.profile:
+            with profiled(args.profile):
+                scraper.reset()
+                for profile in profiles:
+                    failed += handleEvents(scraper.events(profile), exporter, args.new_only)
+        else:
+            failed = handleEvents(scheduler.events(profiles), exporter, args.new_only)
+    except KeyboardInterrupt:
+        scraper.cancel()
+        return 130
+    finally:
+        scraper.close()
+        exporter.close()
+        if args.stats:
+            scraper.stats.dump(sys.stderr if args.stats == "-" else args.stats)
+    # Cron can tell a failed run from one with no results
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""
+SQLite setup shared by the stores: the response cache, the seen store, the checkpoints, the Alko prices
+and the Tori watches.
+"""
+
+import os
+import sqlite3
+
+
+def openDatabase(path):
+    """
+    Connects to the SQLite database file in path, its folder is created if needed.
+    The connection can be used from any thread, the stores lock around it themselves. WAL keeps readers from
+    blocking on the writes.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
@@ -0,0 +1,465 @@
+"""
+Duunitori scraping core, independent of the UI.
+
+Used by the Duunitori tab in the desktop app and by the headless command line runner (cli.py),
+so it must not import tkinter. A scrape is a generator of events: Job records as they are found,
+Progress after every listing page and Finished at the end.
+The HTTP stack (requests) and the HTML parsers are imported when a scraper is built or a page is parsed,
+so importing this module is cheap for the app and the command line runner.
+"""
+
+from collections import deque
+from threading import Event, Lock
+import os
+import time
+from seen import SeenStore, dedupeKey
+from checkpoint import Checkpoints
+from stats import Stats
+from engine import Progress, Finished
+from profiles import profileQuery
+
+BASE_URL = "https://duunitori.fi/"
+
+# Concurrent requests in flight and maximum requests per second to duunitori.fi
+# Listing pages are fetched up to prefetch pages ahead of the one being handled
+# Cached listing pages are revalidated after listing_ttl seconds, job pages after detail_ttl seconds
+# Runs are checkpointed to the checkpoints database, resume continues an interrupted run where it stopped
+# dedupe leaves out jobs already found in the run, by link or by VatID and title, also when another profile found them
+# Detail pages of jobs in the seen store are fetched again after refresh_after seconds to catch changes
+# With parse_processes, detail pages are parsed in that many worker processes, 0 parses them in the scraping threads
+# base_url can point the scraper to a stand-in server, see benchmarks/mock_server.py
+SETTINGS = {"base_url": BASE_URL,
+            "workers": 8,
+            "rate": 5,
+            "cache": os.path.dirname(os.getcwd()) + "/cache/http_cache.sqlite",
+            "seen": os.path.dirname(os.getcwd()) + "/cache/seen.sqlite",
+            "checkpoints": os.path.dirname(os.getcwd()) + "/cache/checkpoints.sqlite",
+            "resume": False,
+            "prefetch": 2,
+            "listing_ttl": 10 * 60,
+            "detail_ttl": 24 * 60 * 60,
+            "offline": False,
+            "dedupe": True,
+            "refresh_after": 7 * 24 * 60 * 60,
+            "parse_processes": 0,
+            }
+
+
+def getUrl(profile, base_url=BASE_URL):
+    """
+    Search url of the profile, the listing pages add &sivu=N to it.
+    Profiles loaded from files come with their query encoded already (see profiles.py), others get it encoded here.
+    """
+    query = profile.get("query")
+    if query is None:
+        query = profileQuery(profile)
+    return base_url + "tyopaikat?" + query
+
+
+class ListingFailed(Exception):
+    """
+    Raised from a scrape when its first listing page can't be fetched
+    """
+
+
+class Job:
+    """
+    One job listing. Timestamps are from the seen store, or the time of the scrape if it isn't used.
+    profile is the name of the search profile that found the job.
+    status is what the seen store says happened to it since the profile's last run: "new", "reposted", "reappeared",
+    "changed", or None if nothing did or the seen store isn't used.
+    """
+
+    __slots__ = ("title", "location", "employer", "vatid", "field", "link", "first_seen", "last_seen", "profile",
+                 "status")
+    FIELDS = __slots__
+
+    def __init__(self, title, location="-", employer="-", vatid="-", field="-", link=None,
+                 first_seen=None, last_seen=None, profile=None, status=None):
+        self.title = title
+        self.location = location
+        self.employer = employer
+        self.vatid = vatid
+        self.field = field
+        self.link = link
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.profile = profile
+        self.status = status
+
+    @classmethod
+    def fromDict(cls, job):
+        return cls(**{key: job[key] for key in cls.FIELDS if key in job})
+
+    def asDict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def __repr__(self):
+        return "Job(%r, %r)" % (self.title, self.link)
+
+
+class Scraper:
+    """
+    Scrapes job listings for search profiles.
+    fetcher -- Fetcher used for all the requests
+    seen -- SeenStore of earlier runs, jobs found in it don't get their detail page fetched again
+    stats -- stats.Stats the run is instrumented with, the fetcher's stats are used if not given
+    checkpoints -- checkpoint.Checkpoints the progress of every run is saved to, for resuming interrupted runs
+    parse_pool -- parsing.ParsePool the detail pages are parsed in, they're parsed in the scraping threads without it
+    Several profiles can be scraped at once from different threads (see scheduler.py). They share the fetcher,
+    so also its per-host rate limit, and a job found by more than one profile is only fetched and parsed once.
+    """
+
+    def __init__(self, fetcher, seen=None, settings=None, stats=None, checkpoints=None, parse_pool=None):
+        self.settings = dict(SETTINGS, **(settings or {}))
+        self.fetcher = fetcher
+        self.seen = seen
+        self.checkpoints = checkpoints
+        self.parsePool = parse_pool
+        self.stats = stats or fetcher.stats or Stats()
+        fetcher.stats = self.stats
+        self.__stop = Event()
+        # Detail page requests in flight and the jobs parsed during this run, by link
+        self.__lock = Lock()
+        self.__pending = {}
+        self.__parsed = {}
+        # Links and dedupe keys of the jobs yielded during this run
+        self.__yielded = set()
+
+    @classmethod
+    def fromSettings(cls, settings=None):
+        """
+        Builds a scraper with the shared session, the response cache, the seen store, the checkpoints and the parse pool
+        from settings. Falsy "cache", "seen" or "checkpoints" paths or "parse_processes" leave them out.
+        """
+        from fetcher import Fetcher
+        from session import getSession
+        from cache import ResponseCache, CachedSession
+        import parsing
+
+        settings = dict(SETTINGS, **(settings or {}))
+        session = getSession(settings["workers"])
+        if settings["cache"]:
+            session = CachedSession(session, ResponseCache(settings["cache"]),
+                                    ttl=settings["detail_ttl"], offline=settings["offline"])
+        fetcher = Fetcher(workers=settings["workers"], rate=settings["rate"], session=session)
+        seen = SeenStore(settings["seen"]) if settings["seen"] else None
+        checkpoints = Checkpoints(settings["checkpoints"]) if settings["checkpoints"] else None
+        parse_pool = parsing.ParsePool(settings["parse_processes"]) if settings["parse_processes"] else None
+        return cls(fetcher, seen, settings, checkpoints=checkpoints, parse_pool=parse_pool)
+
+    def setOffline(self, offline):
+        """
+        Offline mode replays earlier responses from the cache without touching the network
+        """
+        self.settings["offline"] = offline
+        if hasattr(self.fetcher.session, "offline"):
+            self.fetcher.session.offline = offline
+
+    def cancel(self):
+        """
+        Stops a running scrape, pending requests are dropped right away
+        """
+        self.__stop.set()
+        self.fetcher.cancel()
+
+    def cancelled(self):
+        return self.__stop.is_set()
+
+    def reset(self):
+        """
+        Clears the cancel flag and the jobs shared between profiles for a new run
+        """
+        self.__stop.clear()
+        self.fetcher.reset()
+        self.stats.reset()
+        with self.__lock:
+            self.__pending.clear()
+            self.__parsed.clear()
+            self.__yielded.clear()
+
+    def events(self, profile, resume=None):
+        """
+        Goes through the results, extracting the data in the info cell of each job.
+        eg. Location, business name, VatID, and field.
+        The first listing page gives both the first results and the number of pages, so the first jobs come after
+        a single round-trip. The next listing pages are prefetched while detail pages of earlier ones are fetched.
+        Everything is fetched concurrently by the fetcher, but consumed in order,
+        so the jobs come out in the same order as the site lists them.
+        Only jobs not seen in earlier runs get their detail page fetched, the rest come from the seen store.
+        With resume (defaults to the resume setting) an interrupted run continues from its checkpoint:
+        the jobs of the pages it finished are replayed and the scrape goes on from the first unfinished page.
+        Yields a Job for every job found, Progress after each listing page and Finished as the last event.
+        Raises ListingFailed if the first listing page fails, a cancel while waiting for it gives Finished(False).
+        """
+        # A resumed run keeps the start of the interrupted one for the seen store, the stats time this one
+        started = run_start = time.time()
+        name = profile.get("name")
+        base_url = getUrl(profile, self.settings["base_url"])
+        ttl = self.settings["listing_ttl"]
+        if resume is None:
+            resume = self.settings["resume"]
+
+        # Listing pages finished in a row from the first one, and jobs collected from the pages after them
+        done = 0
+        pages = 1
+        collected = {}
+        checkpoint = None
+        if self.checkpoints is not None:
+            checkpoint = self.checkpoints.load(base_url) if resume else None
+            if checkpoint is None:
+                self.checkpoints.begin(base_url, run_start)
+        if checkpoint is not None:
+            run_start = checkpoint.started
+            done, pages = checkpoint.done, checkpoint.pages
+            collected = checkpoint.collected
+            yield from self.__replay(checkpoint, name)
+
+        # Every listing page and detail page must go through for the listings missing from the results
+        # to count as removed
+        complete = True
+        # Listing page requests in flight, (page number, future) in page order
+        prefetched = deque()
+        page_num = done + 1
+        next_page = page_num + 1
+
+        def prefetch():
+            nonlocal next_page
+            while next_page <= pages and len(prefetched) < self.settings["prefetch"]:
+                url = base_url + "&sivu=" + str(next_page)
+                prefetched.append((next_page, self.fetcher.submit(url, stage="listing_fetch", ttl=ttl)))
+                next_page += 1
+
+        try:
+            if page_num <= pages:
+                # Waited for through the fetcher, so a cancel doesn't have to wait for a slow first page
+                future = self.fetcher.submit(base_url + "&sivu=" + str(page_num), stage="listing_fetch", ttl=ttl)
+                site = self.fetcher.result(future)
+                if self.cancelled() or self.fetcher.cancelled():
+                    yield Finished(False, name)
+                    return
+                # Without the first page there's no telling the results from an empty search
+                if site is None:
+                    raise ListingFailed("%s: listing page %d failed: %s" % (name, page_num, future.exception()))
+                if not site.ok:
+                    raise ListingFailed("%s: listing page %d failed with HTTP %d" % (name, page_num, site.status_code))
+            first_page = True
+            while page_num <= pages:
+                if site is None or not site.ok:
+                    complete = False
+                    links = []
+                else:
+                    links, last = self.__parseListing(site)
+                    # Pagination may only link pages near the current one, so the count can grow on the way
+                    pages = max(pages, last)
+                prefetch()
+
+                page_ok = yield from self.__scrapePage(base_url, name, links, page_num, collected,
+                                                       started if first_page else None)
+                first_page = False
+                self.stats.count("listing_pages")
+                if self.cancelled():
+                    break
+                # A job missing from the results of this run would be taken as removed
+                if not page_ok:
+                    complete = False
+                if self.checkpoints is not None and site is not None and site.ok and page_ok and page_num == done + 1:
+                    done = page_num
+                    self.checkpoints.pageDone(base_url, done, pages)
+                yield Progress(page_num, pages, name)
+
+                if not prefetched or self.cancelled():
+                    break
+                page_num, future = prefetched.popleft()
+                site = self.fetcher.result(future)
+        finally:
+            for _, future in prefetched:
+                future.cancel()
+
+        if self.cancelled():
+            yield Finished(False, name)
+            return
+        if complete:
+            if self.seen is not None:
+                self.seen.markRemoved(base_url, run_start)
+            if self.checkpoints is not None:
+                self.checkpoints.finish(base_url)
+        yield Finished(True, name)
+
+    def jobs(self, profile):
+        """
+        Just the jobs of a scrape, without the progress events
+        """
+        return (event for event in self.events(profile) if isinstance(event, Job))
+
+    def __parseListing(self, site):
+        """
+        Returns the job links and the page count of a listing page, no links and 1 page for a failed request
+        """
+        if not site.ok:
+            return [], 1
+        import parsing
+        with self.stats.timer("parse_listing"):
+            hrefs, pages = parsing.parseListing(site.content)
+        return [self.settings["base_url"] + href for href in hrefs], pages
+
+    def __replay(self, checkpoint, name):
+        """
+        Yields the jobs and progress of the pages an interrupted run finished
+        """
+        for page in range(1, checkpoint.done + 1):
+            for job in checkpoint.finished.get(page, ()):
+                if not self.__claim(job):
+                    continue
+                self.stats.count("jobs_resumed")
+                yield Job.fromDict(dict(job, profile=name))
+            yield Progress(page, checkpoint.pages, name)
+
+    def __scrapePage(self, base_url, name, links, page_num, collected, run_start=None):
+        """
+        Yields the jobs of one listing page. collected has jobs saved to the checkpoint by an interrupted run.
+        With run_start the time from it to the first job is recorded as the first_job stage.
+        Returns True if every job on the page went through, a known job whose refresh failed is yielded as stored
+        but doesn't count as gone through.
+        """
+        ok = True
+        known = {}
+        # Stored copies of the known jobs fetched again
+        refreshed = {}
+        for link in links:
+            job = collected.get(link) or self.__parsed.get(link)
+            if job is None and self.seen is not None:
+                job = self.seen.lookup(link)
+                # Old enough jobs get their detail page fetched again to see if they've changed
+                if job is not None and time.time() - (job["updated"] or 0) > self.settings["refresh_after"]:
+                    refreshed[link] = job
+                    job = None
+            known[link] = job
+        detail_pages = {link: self.__detailPage(link) for link in links if known[link] is None}
+
+        for position, (link, job, parsed) in enumerate(self.__detailJobs(links, known, detail_pages)):
+            if self.cancelled():
+                return False
+            now = time.time()
+            if parsed and job is None:
+                ok = False
+                self.stats.count("jobs_failed")
+                if link not in refreshed:
+                    continue
+                # Still listed, so keep the stored copy instead of letting it count as vanished
+                job, parsed = refreshed[link], False
+            if parsed:
+                job["link"] = link
+                job["first_seen"] = refreshed[link]["first_seen"] if link in refreshed else now
+                if self.seen is not None:
+                    job["status"] = self.seen.record(base_url, link, job, now)
+                    if job["status"] == "changed":
+                        self.stats.count("jobs_changed")
+                self.__parsed[link] = job
+            else:
+                self.stats.count("jobs_known")
+                job = dict(job, status=None)
+                if self.seen is not None:
+                    job["status"] = self.seen.record(base_url, link, now=now)
+
+            job = dict(job, last_seen=now)
+            if self.checkpoints is not None:
+                self.checkpoints.record(base_url, page_num, position, job)
+            if not self.__claim(job):
+                self.stats.count("duplicates")
+                continue
+            if run_start is not None:
+                self.stats.observe("first_job", time.time() - run_start)
+                run_start = None
+            self.stats.count("jobs")
+            yield Job.fromDict(dict(job, profile=name))
+        return ok and not self.cancelled()
+
+    def __detailJobs(self, links, known, detail_pages):
+        """
+        Yields (link, job, parsed) for the links in order. parsed is True if the job was parsed from its detail page
+        here, job is then None if the page failed. With a parse pool, the detail pages are parsed in the pool
+        a few links ahead of the one being yielded, otherwise one at a time in this thread.
+        """
+        ahead = deque()
+        limit = self.parsePool.processes * 2 if self.parsePool is not None else 0
+        for link in links:
+            if self.cancelled():
+                return
+            ahead.append((link, self.__startParse(link, known[link], detail_pages)))
+            while len(ahead) > limit:
+                yield self.__finishParse(*ahead.popleft())
+        while ahead and not self.cancelled():
+            yield self.__finishParse(*ahead.popleft())
+
+    def __startParse(self, link, job, detail_pages):
+        """
+        Waits for the detail page of link if the job isn't known, and starts parsing it.
+        Returns the job, the page content or a future from the parse pool.
+        """
+        # Another profile may have parsed the job while this one was waiting
+        job = job or self.__parsed.get(link)
+        if job is not None:
+            return job
+        page = self.fetcher.result(detail_pages[link])
+        job = self.__parsed.get(link)
+        if job is not None:
+            return job
+        with self.__lock:
+            self.__pending.pop(link, None)
+        if page is None or not page.ok:
+            return None
+        if self.parsePool is not None:
+            return self.parsePool.submitJob(page.content)
+        return page.content
+
+    def __finishParse(self, link, started):
+        """
+        Returns (link, job, parsed) from what __startParse returned
+        """
+        if isinstance(started, dict):
+            return link, started, False
+        if started is None:
+            return link, None, True
+        with self.stats.timer("parse_detail"):
+            if isinstance(started, bytes):
+                import parsing
+                return link, parsing.parseJob(started), True
+            return link, started.result(), True
+
+    def __claim(self, job):
+        """
+        Returns False if dedupe is on and a job with the same link or the same VatID and title has already been
+        yielded in this run, otherwise marks the job as yielded
+        """
+        if not self.settings["dedupe"]:
+            return True
+        key = dedupeKey(job)
+        with self.__lock:
+            if job["link"] in self.__yielded or (key is not None and key in self.__yielded):
+                return False
+            self.__yielded.add(job["link"])
+            if key is not None:
+                self.__yielded.add(key)
+        return True
+
+    def __detailPage(self, link):
+        """
+        Returns a future for the detail page of link, shared with other profiles asking for the same link
+        """
+        with self.__lock:
+            future = self.__pending.get(link)
+            if future is None:
+                future = self.fetcher.submit(link, stage="detail_fetch", ttl=self.settings["detail_ttl"])
+                self.__pending[link] = future
+            return future
+
+    def close(self):
+        self.cancel()
+        self.fetcher.close()
+        if self.seen is not None:
+            self.seen.close()
+        if self.checkpoints is not None:
+            self.checkpoints.close()
+        if self.parsePool is not None:
+            self.parsePool.close()
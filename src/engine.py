@@ -0,0 +1,226 @@
+"""
+Site scraper plugins and the engine they all run on.
+
+A site is described by a SitePlugin: the first urls of a search, the records and further urls (next pages,
+detail pages) every fetched page gives, and the columns of its records. The Engine does the rest the same way for
+every site, on one shared Fetcher: pooled connections of the shared session, the response cache, per-host rate
+limiting and concurrent requests. A new site only has to implement the plugin and gets a results tab in the app.
+
+A crawl is a generator of events like a Duunitori scrape: records (dictionaries with the plugin's columns) as they
+are found, Progress after every page and Finished at the end.
+An engine built from settings makes its fetcher on first use, so requests is only imported when a crawl starts.
+"""
+
+from collections import deque
+from threading import Event, Lock
+import os
+from stats import Stats
+
+# Concurrent requests and requests per second to each host, and the response cache shared with the Duunitori scraper
+SETTINGS = {"workers": 8,
+            "rate": 2,
+            "cache": os.path.dirname(os.getcwd()) + "/cache/http_cache.sqlite",
+            "offline": False,
+            }
+
+
+class Progress:
+    """
+    Sent after each listing page is done
+    """
+
+    __slots__ = ("page", "pages", "profile")
+
+    def __init__(self, page, pages, profile=None):
+        self.page = page
+        self.pages = pages
+        self.profile = profile
+
+
+class Finished:
+    """
+    Last event of a scrape. completed is False if the scrape was cancelled.
+    """
+
+    __slots__ = ("completed", "profile")
+
+    def __init__(self, completed, profile=None):
+        self.completed = completed
+        self.profile = profile
+
+
+class SitePlugin:
+    """
+    Super class for site plugins.
+    name -- short name, used in the stats stages
+    title -- name of the site's tab
+    columns -- record schema as (key, heading) pairs, the first one is the tree column of the results tab
+    link -- key of the record's url, opened by double-clicking the record in the results tab
+    query_label -- label of the search box in the results tab
+    ttl -- seconds fetched pages are served from the response cache
+    max_pages -- pages fetched in one crawl at most
+    headers -- extra request headers
+    types -- pyarrow type names of the columns that aren't text, for Parquet exports
+    """
+
+    name = ""
+    title = ""
+    columns = ()
+    link = "link"
+    query_label = "Search"
+    ttl = 10 * 60
+    max_pages = 20
+    headers = None
+    types = {}
+
+    def keys(self):
+        return tuple(key for key, heading in self.columns)
+
+    def startUrls(self, query):
+        """
+        Returns the urls a crawl for query starts from
+        """
+        raise NotImplementedError
+
+    def parse(self, url, content):
+        """
+        Extracts a fetched page. Returns (records, urls): the records found on the page as dictionaries,
+        and the urls to fetch next, eg. the next page or detail pages. Urls already fetched in the crawl are skipped.
+        """
+        raise NotImplementedError
+
+    def key(self, record):
+        """
+        Identity of a record, a record with the same key as an earlier one in the crawl is left out
+        """
+        return record.get(self.link)
+
+
+class Crawl:
+    """
+    One run of a plugin on the engine. Has its own cancel flag, so cancelling it doesn't stop other crawls.
+    failed -- pages whose request failed, a crawl with failed pages may have missed records
+    """
+
+    def __init__(self, engine, plugin, query, max_pages=None):
+        self.engine = engine
+        self.plugin = plugin
+        self.query = query
+        self.maxPages = max_pages or plugin.max_pages
+        self.failed = 0
+        self.__stop = Event()
+
+    def cancel(self):
+        self.__stop.set()
+
+    def cancelled(self):
+        return self.__stop.is_set()
+
+    def events(self):
+        """
+        Fetches the start urls and every url the pages lead to, up to maxPages pages.
+        Pages are fetched concurrently but handled in the order they were found, at most window requests ahead.
+        """
+        fetcher = self.engine.fetcher
+        stats = fetcher.stats
+        plugin = self.plugin
+        urls = deque(plugin.startUrls(self.query))
+        found = set(urls)
+        keys = set()
+        # Requests in flight, (url, future) in the order the urls were found
+        inflight = deque()
+        submitted = done = 0
+        try:
+            while urls or inflight:
+                while urls and len(inflight) < self.engine.window and submitted < self.maxPages:
+                    url = urls.popleft()
+                    inflight.append((url, fetcher.submit(url, stage=plugin.name + "_fetch", ttl=plugin.ttl,
+                                                         headers=plugin.headers)))
+                    submitted += 1
+                if not inflight:
+                    break
+                url, future = inflight.popleft()
+                response = fetcher.result(future, self.__stop)
+                if self.cancelled():
+                    break
+                done += 1
+                if response is None or not response.ok:
+                    self.failed += 1
+                    stats.count(plugin.name + "_failed")
+                else:
+                    with stats.timer(plugin.name + "_parse"):
+                        records, more = plugin.parse(url, response.content)
+                    for next_url in more:
+                        if next_url not in found:
+                            found.add(next_url)
+                            urls.append(next_url)
+                    for record in records:
+                        key = plugin.key(record)
+                        if key is not None:
+                            if key in keys:
+                                continue
+                            keys.add(key)
+                        stats.count(plugin.name + "_records")
+                        yield record
+                yield Progress(done, min(len(found), self.maxPages), plugin.name)
+        finally:
+            for url, future in inflight:
+                future.cancel()
+        yield Finished(not self.cancelled(), plugin.name)
+
+
+class Engine:
+    """
+    Runs site plugins on one shared fetcher.
+    fetcher -- fetcher.Fetcher all the requests go through, built from settings on first use if not given
+    window -- requests queued ahead of the page being handled, per crawl
+    settings -- SETTINGS the fetcher is built from
+    """
+
+    def __init__(self, fetcher=None, window=None, settings=None):
+        self.settings = dict(SETTINGS, **(settings or {}))
+        self.__fetcher = None
+        self.__lock = Lock()
+        self.window = window or (fetcher.workers if fetcher is not None else self.settings["workers"]) * 2
+        if fetcher is not None:
+            self.__setFetcher(fetcher)
+
+    @classmethod
+    def fromSettings(cls, settings=None):
+        """
+        Engine with the shared session and the response cache from settings, a falsy "cache" path leaves the cache out
+        """
+        return cls(settings=settings)
+
+    def __setFetcher(self, fetcher):
+        if fetcher.stats is None:
+            fetcher.stats = Stats()
+        self.__fetcher = fetcher
+
+    @property
+    def fetcher(self):
+        if self.__fetcher is None:
+            with self.__lock:
+                if self.__fetcher is None:
+                    from fetcher import Fetcher
+                    from session import getSession
+                    from cache import ResponseCache, CachedSession
+
+                    session = getSession(self.settings["workers"])
+                    if self.settings["cache"]:
+                        session = CachedSession(session, ResponseCache(self.settings["cache"]),
+                                                offline=self.settings["offline"])
+                    self.__setFetcher(Fetcher(workers=self.settings["workers"], rate=self.settings["rate"],
+                                              session=session))
+        return self.__fetcher
+
+    @property
+    def stats(self):
+        return self.fetcher.stats
+
+    def crawl(self, plugin, query=None, max_pages=None):
+        return Crawl(self, plugin, query, max_pages)
+
+    def close(self):
+        if self.__fetcher is not None:
+            self.__fetcher.close()
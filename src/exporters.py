@@ -0,0 +1,194 @@
+"""
+Streaming export of job records to CSV, JSON Lines and Parquet.
+
+Exporters take records one at a time while the scrape is running and write them out as they come,
+so the whole result set is never held in memory. Parquet is written in row groups of chunk_size records
+and needs pyarrow, the other formats only use the standard library.
+The columns default to the Duunitori job columns, the site plugins pass their own along with their column types.
+"""
+
+import csv
+import json
+import os
+
+COLUMNS = ("profile", "title", "location", "employer", "vatid", "field", "link", "first_seen", "last_seen", "status")
+
+
+def _values(record, columns=COLUMNS):
+    """
+    Record as a dictionary, accepts Job records and plain dictionaries
+    """
+    if hasattr(record, "asDict"):
+        record = record.asDict()
+    return {key: record.get(key) for key in columns}
+
+
+class Exporter:
+    """
+    Super class for exporters, usable as a context manager.
+    path -- file path, the text formats also accept an open file object, which is then left open
+    columns -- keys of the records written out
+    types -- pyarrow type names of the columns, eg. {"price": "float64"}, only Parquet needs them
+    """
+
+    extension = ""
+
+    def __init__(self, path, columns=COLUMNS, types=None):
+        self.path = path
+        self.columns = tuple(columns)
+        self.types = dict(types or {})
+        self.count = 0
+
+    def write(self, record):
+        raise NotImplementedError
+
+    def writeMany(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextExporter(Exporter):
+    """
+    Super class for the formats written to a text file
+    """
+
+    def __init__(self, path, columns=COLUMNS, types=None):
+        super().__init__(path, columns, types)
+        self.__owned = not hasattr(path, "write")
+        self.file = open(path, "w", encoding="utf-8", newline="") if self.__owned else path
+
+    def close(self):
+        if self.__owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class CsvExporter(TextExporter):
+    extension = ".csv"
+    dialect = "excel"
+
+    def __init__(self, path, columns=COLUMNS, types=None):
+        super().__init__(path, columns, types)
+        self.__writer = csv.DictWriter(self.file, fieldnames=self.columns, dialect=self.dialect)
+        self.__writer.writeheader()
+
+    def write(self, record):
+        self.__writer.writerow(_values(record, self.columns))
+        self.count += 1
+
+
+class TsvExporter(CsvExporter):
+    extension = ".tsv"
+    dialect = "excel-tab"
+
+
+class JsonLinesExporter(TextExporter):
+    extension = ".jsonl"
+
+    def write(self, record):
+        self.file.write(json.dumps(_values(record, self.columns), ensure_ascii=False) + "\n")
+        self.count += 1
+
+
+class ParquetExporter(Exporter):
+    """
+    Buffers at most chunk_size records and writes them out as one row group.
+    Columns without a type in types get theirs from the first row group. One with no values there can't be told,
+    it's written as text.
+    """
+
+    extension = ".parquet"
+
+    def __init__(self, path, columns=COLUMNS, types=None, chunk_size=5000):
+        super().__init__(path, columns, types)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow, install it with: pip install pyarrow")
+        self.__pa = pyarrow
+        self.__schema = None
+        if self.columns == COLUMNS:
+            self.__schema = pyarrow.schema([(key, pyarrow.float64() if key.endswith("_seen") else pyarrow.string())
+                                            for key in COLUMNS])
+        self.__writer = None
+        self.__chunk_size = chunk_size
+        self.__buffered = 0
+        self.__buffer = {key: [] for key in self.columns}
+
+    def write(self, record):
+        for key, value in _values(record, self.columns).items():
+            self.__buffer[key].append(value)
+        self.count += 1
+        self.__buffered += 1
+        if self.__buffered >= self.__chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.__buffered and self.__writer is not None:
+            return
+        if self.__schema is None:
+            self.__schema = self.__firstSchema()
+        for field in self.__schema:
+            if field.type == self.__pa.string():
+                self.__buffer[field.name] = [value if value is None or isinstance(value, str) else str(value)
+                                             for value in self.__buffer[field.name]]
+        table = self.__pa.Table.from_pydict(self.__buffer, schema=self.__schema)
+        if self.__writer is None:
+            self.__writer = self.__pa.parquet.ParquetWriter(self.path, self.__schema)
+        self.__writer.write_table(table)
+        self.__buffered = 0
+        self.__buffer = {key: [] for key in self.columns}
+
+    def __firstSchema(self):
+        """
+        Declared column types, the rest inferred from the buffered first row group
+        """
+        inferred = self.__pa.Table.from_pydict({key: values for key, values in self.__buffer.items()
+                                                if key not in self.types}).schema
+        fields = []
+        for key in self.columns:
+            if key in self.types:
+                kind = self.__pa.type_for_alias(self.types[key])
+            else:
+                kind = inferred.field(key).type
+                # All None so far, later values could be anything
+                if kind == self.__pa.null():
+                    kind = self.__pa.string()
+            fields.append((key, kind))
+        return self.__pa.schema(fields)
+
+    def close(self):
+        self.flush()
+        self.__writer.close()
+
+
+EXPORTERS = {"csv": CsvExporter,
+             "tsv": TsvExporter,
+             "jsonl": JsonLinesExporter,
+             "parquet": ParquetExporter,
+             }
+
+
+def openExporter(path, format=None, columns=COLUMNS, types=None):
+    """
+    Opens an exporter for path. The format is guessed from the file extension if not given.
+    """
+    if format is None and hasattr(path, "write"):
+        raise ValueError("Give the export format when writing to a file object")
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        format = {".json": "jsonl", ".ndjson": "jsonl"}.get(extension, extension.lstrip("."))
+    if format not in EXPORTERS:
+        raise ValueError("Unknown export format: " + str(format))
+    return EXPORTERS[format](path, columns, types)
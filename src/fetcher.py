@@ -0,0 +1,154 @@
+"""
+Bounded-concurrency fetch engine shared by the scraper tabs.
+
+Requests are run in a thread pool with a fixed number of workers, and every request
+goes through a per-host rate limiter instead of a fixed sleep between requests.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait
+from threading import Event, Lock
+from urllib.parse import urlsplit
+import time
+import requests
+from session import getSession
+
+
+class Cancelled(Exception):
+    """
+    Raised from a fetch when the fetcher has been cancelled
+    """
+
+
+class RateLimiter:
+    """
+    Per-host rate limiter, spaces out requests to the same host by 1 / rate seconds.
+    Rate of 0 or None means no limit.
+    """
+
+    def __init__(self, rate=None):
+        self.__interval = 1 / rate if rate else 0
+        self.__next_slot = {}
+        self.__lock = Lock()
+
+    def wait(self, host, cancel_event=None):
+        """
+        Reserve the next free slot for host and sleep until it.
+        Returns False if cancel_event got set while waiting.
+        """
+        if not self.__interval:
+            return True
+
+        with self.__lock:
+            now = time.monotonic()
+            slot = max(now, self.__next_slot.get(host, now))
+            self.__next_slot[host] = slot + self.__interval
+
+        delay = slot - time.monotonic()
+        if delay <= 0:
+            return True
+        if cancel_event is None:
+            time.sleep(delay)
+            return True
+        # Event.wait returns True if the event was set, so waiting gets interrupted by cancel
+        return not cancel_event.wait(delay)
+
+
+class Fetcher:
+    """
+    Thread pool based fetcher.
+    workers -- maximum number of requests in flight
+    rate -- maximum requests per second per host
+    session -- session used for the requests, defaults to the shared session
+    stats -- optional stats.Stats for request counters and timings
+    """
+
+    def __init__(self, workers=8, rate=5, session=None, stats=None):
+        self.__pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetcher")
+        self.__limiter = RateLimiter(rate)
+        self.__cancel = Event()
+        self.session = session or getSession(workers)
+        self.workers = workers
+        self.stats = stats
+
+    def cancel(self):
+        """
+        Stop all pending work. Requests already in flight finish on their own timeout, but their results are dropped.
+        """
+        self.__cancel.set()
+
+    def cancelled(self):
+        return self.__cancel.is_set()
+
+    def reset(self):
+        """
+        Clear the cancel flag so the fetcher can be used for another run
+        """
+        self.__cancel.clear()
+
+    def close(self):
+        self.cancel()
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+
+    def get(self, url, stage="fetch", **kwargs):
+        """
+        Blocking GET through the rate limiter, kwargs are passed on to the session.
+        Responses a caching session can serve locally skip the rate limiter.
+        stage -- name the request time is recorded under in stats
+        """
+        if self.__cancel.is_set():
+            raise Cancelled(url)
+        if hasattr(self.session, "cached"):
+            response, entry = self.session.cached(url, kwargs.get("ttl"))
+            if response is not None:
+                self.__count("cache_hits")
+                return response
+            # Saves the session looking the url up again
+            kwargs["entry"] = entry
+        else:
+            kwargs.pop("ttl", None)
+
+        start = time.perf_counter()
+        if not self.__limiter.wait(urlsplit(url).hostname, self.__cancel):
+            raise Cancelled(url)
+        requested = time.perf_counter()
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.RequestException:
+            self.__count("failed")
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.observe("rate_limit_wait", requested - start)
+                self.stats.observe(stage, time.perf_counter() - requested)
+                self.stats.count("requests")
+        if not response.ok:
+            self.__count("failed")
+        if self.__cancel.is_set():
+            raise Cancelled(url)
+        return response
+
+    def __count(self, name):
+        if self.stats is not None:
+            self.stats.count(name)
+
+    def submit(self, url, **kwargs):
+        """
+        Schedule a GET in the pool, returns a Future
+        """
+        return self.__pool.submit(self.get, url, **kwargs)
+
+    def result(self, future, cancel_event=None):
+        """
+        Waits for a submitted request, failed and cancelled requests give None so one bad page doesn't end the run.
+        A cancel of the fetcher, or setting cancel_event, ends the wait right away, a request in flight is left
+        to finish on its own.
+        """
+        while not future.done():
+            if self.__cancel.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                future.cancel()
+                return None
+            wait((future,), timeout=0.1)
+        try:
+            return future.result()
+        except (Cancelled, CancelledError, requests.RequestException):
+            return None
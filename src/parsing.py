@@ -0,0 +1,183 @@
+"""
+HTML parsing for the Duunitori pages.
+
+Uses the fastest backend available: selectolax if it's installed, otherwise BeautifulSoup with lxml,
+and html.parser as the last fallback. With BeautifulSoup only the parts of the page that are needed get built,
+using SoupStrainers, instead of the whole document tree.
+All returned values are plain strings, so no references to the parse tree are kept around.
+Detail pages can also be parsed in worker processes with ParsePool, which takes the parsing out from under the GIL.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# Info listing headings and the job fields they map to
+HEADINGS = {"Työpaikan sijainti": "location",
+            "Toiminimi": "employer",
+            "Y-tunnus": "vatid",
+            "Toimiala": "field",
+            }
+
+RESULT_CLASS = "job-box__hover gtm-search-result"
+INFO_CLASS = "1/1 grid__cell info-listing"
+
+
+def _jobClasses(value):
+    """
+    Matches the title and the info cell. Depending on the bs4 version the class attribute is seen either
+    as the raw string or already split into a list.
+    """
+    if not value:
+        return False
+    classes = value.split() if isinstance(value, str) else value
+    return "header__title" in classes or "info-listing" in classes
+
+
+_job_strainer = SoupStrainer(["h1", "div"], class_=_jobClasses)
+
+
+def _listingClasses(value):
+    """
+    Matches the job results and the pagination links, see _jobClasses for the two forms of value
+    """
+    if not value:
+        return False
+    if not isinstance(value, str):
+        value = " ".join(value)
+    return value == RESULT_CLASS or "pagination__pagenum" in value.split()
+
+
+_listing_strainer = SoupStrainer("a", class_=_listingClasses)
+
+_page_number = re.compile(r"sivu=(\d+)")
+
+
+def makeSoup(content, strainer=None):
+    """
+    BeautifulSoup with the fastest available parser, only building the tags matching strainer
+    """
+    return BeautifulSoup(content, PARSER, parse_only=strainer)
+
+
+def _text(node):
+    """
+    Text of a node as a plain string, the text of nested tags included like selectolax does. None stays None.
+    """
+    if node is None:
+        return None
+    return (node.text() if HTMLParser is not None else node.get_text()).strip()
+
+
+def parseListing(content):
+    """
+    Parses a listing page in one go, returns (result hrefs, number of the last page)
+    """
+    if HTMLParser is not None:
+        tree = HTMLParser(content)
+        hrefs = [node.attributes.get("href") for node in tree.css("a.job-box__hover.gtm-search-result")
+                 if node.attributes.get("href")]
+        links = [(node.attributes.get("href") or "", node.text()) for node in tree.css("a.pagination__pagenum")]
+        return hrefs, _lastPage(links)
+
+    soup = makeSoup(content, _listing_strainer)
+    hrefs = [result["href"] for result in soup.find_all("a", class_=RESULT_CLASS) if result.get("href")]
+    links = [(link.get("href") or "", link.get_text()) for link in soup.find_all("a", class_="pagination__pagenum")]
+    return hrefs, _lastPage(links)
+
+
+def _lastPage(links):
+    """
+    Highest page number in (href, text) pairs of pagination links, at least 1
+    """
+    pages = 1
+    for href, text in links:
+        match = _page_number.search(href)
+        number = match.group(1) if match else text.strip()
+        if number.isdigit():
+            pages = max(pages, int(number))
+    return pages
+
+
+def parseJob(content):
+    """
+    Extracts the job title and the data in the info cell from a job's detail page.
+    Returns a dictionary, or None if the page has no info cell.
+    """
+    job = {"title": None, "location": "-", "employer": "-", "vatid": "-", "field": "-"}
+
+    if HTMLParser is not None:
+        tree = HTMLParser(content)
+        job["title"] = _text(tree.css_first("h1.header__title"))
+        info_cell = None
+        for node in tree.css("div.info-listing"):
+            if node.attributes.get("class") == INFO_CLASS:
+                info_cell = node
+                break
+        if info_cell is None:
+            return None
+        for block in info_cell.css("div.info-listing__block"):
+            key = HEADINGS.get(_text(block.css_first("h4.info-listing__heading")))
+            if key is not None:
+                job[key] = _text(block.css_first("div.info-listing__value span"))
+        return job
+
+    soup = makeSoup(content, _job_strainer)
+    job["title"] = _text(soup.find("h1", class_="header__title"))
+    info_cell = soup.find("div", class_=INFO_CLASS)
+    if info_cell is None:
+        return None
+    for block in info_cell.find_all("div", class_="info-listing__block"):
+        key = HEADINGS.get(_text(block.find("h4", class_="info-listing__heading")))
+        value_block = block.find("div", class_="info-listing__value")
+        if key is not None and value_block is not None:
+            job[key] = _text(value_block.find("span"))
+    return job
+
+
+def _ready():
+    return os.getpid()
+
+
+def _parseJob(content):
+    # Looked up at call time, so the pool uses the same parseJob as the rest of the module
+    return parseJob(content)
+
+
+class ParsePool:
+    """
+    Parses detail pages in worker processes, so parsing runs on every core instead of taking turns on the GIL.
+    Only the raw page bytes are sent to the workers and only the small job dictionaries come back.
+    processes -- number of worker processes, defaults to the number of cores
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.__pool = ProcessPoolExecutor(max_workers=self.processes)
+        # Workers are started on demand, get them all running before the first pages come in
+        for future in [self.__pool.submit(_ready) for _ in range(self.processes)]:
+            future.result()
+
+    def submitJob(self, content):
+        """
+        Returns a future for parseJob(content)
+        """
+        return self.__pool.submit(_parseJob, content)
+
+    def close(self):
+        self.__pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,248 @@
+"""
+Loading and saving Duunitori search profiles.
+
+Profiles are TOML or JSON files with one or more profiles each, checked against SCHEMA when loaded:
+
+[[profiles]]
+name = "python"
+keywords = ["python", "django"]
+locations = ["Helsinki", "Espoo"]
+searchDesc = false
+
+A JSON file is a list of profiles, {"profiles": [...]} or a single profile. A file with only one profile, on its own
+or as the only one in a list, can leave its name out and is then named after the file.
+The name tells apart results of profiles scraped together, so the names must be unique.
+
+The old text format with one key=value line per setting, lists separated with commas, is still read:
+keywords=python,java
+locations=Helsinki,Espoo
+searchDesc=False
+
+Loaded profiles get their url query encoded once, in "query", so building the urls of a batch of profiles
+costs nothing per page.
+"""
+
+from urllib.parse import urlencode, quote
+import json
+import os
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Profile keys and their types, lists are lists of strings
+SCHEMA = {"name": str,
+          "keywords": list,
+          "locations": list,
+          "searchDesc": bool,
+          }
+REQUIRED_KEYS = ("keywords", "locations", "searchDesc")
+FORMATS = {".txt": "txt", ".json": "json", ".toml": "toml"}
+
+_BOOLEANS = {"true": True, "1": True, "yes": True, "false": False, "0": False, "no": False, "": False}
+
+
+def _words(value):
+    """
+    Clean list of the words of a comma separated string or a list, empty ones left out
+    """
+    if isinstance(value, str):
+        value = value.split(",")
+    return [word.strip() for word in value if word.strip()]
+
+
+def profileQuery(profile):
+    """
+    Encoded url query of the profile's search, keywords and locations are separated with semicolons
+    """
+    params = [("haku", ";".join(profile["keywords"]))]
+    if profile["locations"]:
+        params.append(("alue", ";".join(profile["locations"])))
+    if profile["searchDesc"]:
+        params.append(("search_also_descr", "1"))
+    return urlencode(params, quote_via=quote)
+
+
+def validateProfile(data, where="Search profile"):
+    """
+    Checks a profile against SCHEMA and returns it cleaned up, with the encoded "query".
+    Missing locations and searchDesc default to none and False.
+    Raises ValueError naming the offending key.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(where + ": a profile must be a table of settings")
+    unknown = sorted(set(data) - set(SCHEMA))
+    if unknown:
+        raise ValueError(where + ": unknown setting " + ", ".join(unknown))
+    if "keywords" not in data:
+        raise ValueError(where + ": keywords missing")
+    profile = {"locations": [], "searchDesc": False}
+    for key, value in data.items():
+        kind = SCHEMA[key]
+        if kind is list:
+            if isinstance(value, str):
+                value = [value]
+            if not isinstance(value, list) or not all(isinstance(word, str) for word in value):
+                raise ValueError(where + ": " + key + " must be a list of strings")
+            value = _words(value)
+        elif not isinstance(value, kind):
+            raise ValueError(where + ": " + key + " must be " + ("true or false" if kind is bool else "a string"))
+        profile[key] = value
+    profile["query"] = profileQuery(profile)
+    return profile
+
+
+def parseProfile(lines):
+    """
+    Parses the lines of an old style text profile into the profile dictionary.
+    Raises ValueError if the formatting is off or any of the required keys is missing.
+    """
+    data = {}
+    for line in lines:
+        line = line.strip("\n")
+        if not line:
+            continue
+        if "=" not in line:
+            raise ValueError("Incorrect search profile formatting")
+        key, value = line.split("=", 1)
+        data[key.strip()] = value
+
+    for key in REQUIRED_KEYS:
+        if key not in data:
+            raise ValueError("Incorrect search profile formatting")
+    # The old format keeps everything as text, eg. searchDesc=False
+    search_desc = _BOOLEANS.get(data["searchDesc"].strip().lower())
+    if search_desc is None:
+        raise ValueError("Search profile: searchDesc must be True or False")
+    data["searchDesc"] = search_desc
+    for key in ("keywords", "locations"):
+        data[key] = _words(data[key])
+    return validateProfile(data)
+
+
+def parseProfiles(text, format, name="profile"):
+    """
+    Parses the profiles of a file's text in format ("toml", "json" or "txt"), name is the default for an unnamed
+    single profile. Raises ValueError if any of the profiles doesn't fit the schema.
+    """
+    if format == "txt":
+        return [dict(parseProfile(text.splitlines()), name=name)]
+    if format == "json":
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ValueError("Incorrect JSON in search profile: %s" % e)
+    elif format == "toml":
+        if tomllib is None:
+            raise ValueError("Reading TOML profiles needs Python 3.11 or the tomli package")
+        try:
+            data = tomllib.loads(text)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError("Incorrect TOML in search profile: %s" % e)
+    else:
+        raise ValueError("Unknown search profile format " + str(format))
+
+    if isinstance(data, dict) and "profiles" in data:
+        if set(data) != {"profiles"} or not isinstance(data["profiles"], list):
+            raise ValueError("Search profile: profiles must be a list of profiles with nothing next to it")
+        data = data["profiles"]
+    if isinstance(data, dict):
+        return [dict(validateProfile(data), name=data.get("name") or name)]
+    if not isinstance(data, list) or not data:
+        raise ValueError("Search profile: no profiles found")
+
+    profiles = []
+    names = set()
+    for number, item in enumerate(data, 1):
+        profile = validateProfile(item, "Search profile %d" % number)
+        if not profile.get("name") and len(data) == 1:
+            profile["name"] = name
+        elif not profile.get("name"):
+            raise ValueError("Search profile %d: name missing, every profile of a file with many needs one" % number)
+        if profile["name"] in names:
+            raise ValueError("Search profile %d: name %s is used twice" % (number, profile["name"]))
+        names.add(profile["name"])
+        profiles.append(profile)
+    return profiles
+
+
+def profileName(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def profileFormat(path):
+    """
+    Format of a profile file by its extension, files without a known one are read as old style text
+    """
+    return FORMATS.get(os.path.splitext(path)[1].lower(), "txt")
+
+
+def loadProfiles(path):
+    """
+    Reads and parses all the profiles of the file in path
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return parseProfiles(f.read(), profileFormat(path), profileName(path))
+
+
+def loadProfileFiles(paths):
+    """
+    Loads the profiles of all the files, the names must be unique across the files too
+    """
+    profiles = []
+    names = set()
+    for path in paths:
+        for profile in loadProfiles(path):
+            if profile["name"] in names:
+                raise ValueError("%s: profile name %s is already used by another profile" % (path, profile["name"]))
+            names.add(profile["name"])
+            profiles.append(profile)
+    return profiles
+
+
+def loadProfile(path):
+    """
+    Reads and parses the profile file in path, a file with several profiles gives the first one
+    """
+    return loadProfiles(path)[0]
+
+
+def formatProfiles(profiles, format="toml"):
+    """
+    Returns the text of a profile file with profiles in format, the old text format takes one profile only
+    """
+    profiles = [{key: profile[key] for key in SCHEMA if key in profile} for profile in profiles]
+    if format == "json":
+        return json.dumps(profiles[0] if len(profiles) == 1 else {"profiles": profiles}, ensure_ascii=False,
+                          indent=2) + "\n"
+    if format == "txt":
+        if len(profiles) != 1:
+            raise ValueError("A text profile file takes only one profile")
+        profile = profiles[0]
+        return "".join((key + "=" + ",".join(profile[key]) + "\n") for key in ("keywords", "locations")) + \
+            "searchDesc=" + str(profile["searchDesc"]) + "\n"
+
+    # TOML strings and lists of them are written the same way as in JSON
+    lines = []
+    for profile in profiles:
+        if len(profiles) > 1:
+            lines.append("[[profiles]]")
+        for key in SCHEMA:
+            if key not in profile:
+                continue
+            value = profile[key]
+            value = ("true" if value else "false") if isinstance(value, bool) else json.dumps(value, ensure_ascii=False)
+            lines.append(key + " = " + value)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def formatProfile(keywords, locations, searchDesc, format="toml"):
+    """
+    Returns the text of a profile file with a single profile
+    """
+    return formatProfiles([{"keywords": keywords, "locations": locations, "searchDesc": bool(searchDesc)}], format)
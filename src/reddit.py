@@ -0,0 +1,63 @@
+"""
+Reddit site plugin: the newest posts of subreddits, read from Reddit's JSON listings.
+"""
+
+from urllib.parse import quote
+import json
+import time
+from engine import SitePlugin
+
+BASE_URL = "https://www.reddit.com/"
+
+
+class RedditPlugin(SitePlugin):
+    """
+    Query is a list of subreddits separated with commas or spaces, eg. "python, learnpython"
+    """
+
+    name = "reddit"
+    title = "Reddit"
+    columns = (("title", "Title"),
+               ("subreddit", "Subreddit"),
+               ("author", "Author"),
+               ("score", "Score"),
+               ("comments", "Comments"),
+               ("created", "Created"),
+               ("link", "Link"),
+               )
+    query_label = "Subreddits"
+    types = {"score": "int64", "comments": "int64"}
+    ttl = 5 * 60
+    max_pages = 10
+    # Posts per listing page, 100 is the most Reddit gives
+    limit = 100
+
+    def __init__(self, base_url=BASE_URL):
+        self.base_url = base_url
+
+    def startUrls(self, query):
+        subreddits = (query or "").replace(",", " ").split()
+        return [self.__listingUrl(subreddit) for subreddit in subreddits]
+
+    def parse(self, url, content):
+        listing = json.loads(content).get("data") or {}
+        records = []
+        for child in listing.get("children", ()):
+            post = child.get("data") or {}
+            records.append({"title": post.get("title"),
+                            "subreddit": post.get("subreddit"),
+                            "author": post.get("author"),
+                            "score": post.get("score"),
+                            "comments": post.get("num_comments"),
+                            "created": time.strftime("%Y-%m-%d %H:%M",
+                                                     time.localtime(post.get("created_utc") or 0)),
+                            "link": self.base_url.rstrip("/") + post.get("permalink", ""),
+                            })
+        # The listing continues after the last post of the page
+        after = listing.get("after")
+        if not after or not records:
+            return records, []
+        return records, [url.split("&after=")[0] + "&after=" + quote(after)]
+
+    def __listingUrl(self, subreddit):
+        return self.base_url + "r/" + quote(subreddit.strip("/").split("/")[-1]) + "/new.json?limit=" + str(self.limit)
@@ -0,0 +1,158 @@
+"""
+Indexed in-memory store of found jobs, for filtering and sorting the job list without touching the widget.
+
+Jobs are kept as the slotted Job records in a list, their row number in the store is their iid in the job list.
+Location, employer, VatID and field have value -> rows indexes, and titles have a word -> rows text index,
+so a filter only looks at the rows that can match. Sort orders are computed once per column and reused until
+new jobs come in.
+
+Filter queries are words separated with spaces. Plain words must each start a word of the title, field:value words
+match the start of that field, eg. "python kehittäjä location:hel field:ohjelmistot", and status:new shows only
+the jobs that are new since the last run.
+"""
+
+from bisect import bisect_left
+import re
+
+INDEXED = ("location", "employer", "vatid", "field", "profile", "status")
+# Columns the job list can be sorted by, "title" is the tree column
+SORTABLE = ("title",) + INDEXED + ("first_seen", "last_seen")
+
+_word = re.compile(r"\w+")
+
+
+def words(text):
+    return _word.findall(text.lower()) if text else []
+
+
+def parseQuery(query):
+    """
+    Splits a filter query into the title words and a field -> value dictionary of field:value words
+    """
+    title = []
+    fields = {}
+    for part in query.split():
+        key, sep, value = part.partition(":")
+        if sep and key.lower() in INDEXED:
+            if value:
+                fields[key.lower()] = value.lower()
+        else:
+            title.extend(words(part))
+    return title, fields
+
+
+class ResultStore:
+    """
+    Jobs of the job list with the indexes for filtering and sorting them. Only used from the Tk thread.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.__jobs = []
+        self.__indexes = {field: {} for field in INDEXED}
+        self.__titles = {}
+        # Title words sorted, for prefix lookups, None when new words have come in
+        self.__titleWords = None
+        self.__orders = {}
+
+    def __len__(self):
+        return len(self.__jobs)
+
+    def __getitem__(self, row):
+        return self.__jobs[row]
+
+    def add(self, job):
+        """
+        Adds a Job, returns its row number
+        """
+        row = len(self.__jobs)
+        self.__jobs.append(job)
+        for field, index in self.__indexes.items():
+            index.setdefault((getattr(job, field) or "").lower(), []).append(row)
+        for word in set(words(job.title)):
+            rows = self.__titles.get(word)
+            if rows is None:
+                rows = self.__titles[word] = []
+                self.__titleWords = None
+            rows.append(row)
+        self.__orders.clear()
+        return row
+
+    def filter(self, query):
+        """
+        Returns the set of rows matching the filter query, None for an empty query which matches everything
+        """
+        title, fields = parseQuery(query)
+        if not title and not fields:
+            return None
+        candidates = [self.__fieldRows(field, value) for field, value in fields.items()]
+        candidates.extend(self.__titleRows(word) for word in title)
+        # Start from the smallest candidate set so the intersections stay small
+        candidates.sort(key=len)
+        rows = candidates[0]
+        for other in candidates[1:]:
+            if not rows:
+                break
+            rows = rows & other
+        return rows
+
+    def matches(self, row, query):
+        """
+        Checks a single row against a filter query without going through the indexes
+        """
+        title, fields = parseQuery(query)
+        job = self.__jobs[row]
+        for field, value in fields.items():
+            if not (getattr(job, field) or "").lower().startswith(value):
+                return False
+        title_words = words(job.title)
+        return all(any(word.startswith(query_word) for word in title_words) for query_word in title)
+
+    def order(self, column, reverse=False):
+        """
+        Returns all the rows sorted by column
+        """
+        key = (column, reverse)
+        rows = self.__orders.get(key)
+        if rows is None:
+            values = [self.__sortValue(job, column) for job in self.__jobs]
+            rows = self.__orders[key] = sorted(range(len(values)), key=values.__getitem__, reverse=reverse)
+        return rows
+
+    def view(self, query="", column=None, reverse=False):
+        """
+        Returns the rows matching query in the order of column, or in the order they were found
+        """
+        rows = self.filter(query)
+        if column is None:
+            return sorted(rows) if rows is not None else range(len(self.__jobs))
+        order = self.order(column, reverse)
+        if rows is None:
+            return order
+        return [row for row in order if row in rows]
+
+    def __fieldRows(self, field, value):
+        rows = set()
+        for key, key_rows in self.__indexes[field].items():
+            if key.startswith(value):
+                rows.update(key_rows)
+        return rows
+
+    def __titleRows(self, prefix):
+        if self.__titleWords is None:
+            self.__titleWords = sorted(self.__titles)
+        rows = set()
+        index = bisect_left(self.__titleWords, prefix)
+        while index < len(self.__titleWords) and self.__titleWords[index].startswith(prefix):
+            rows.update(self.__titles[self.__titleWords[index]])
+            index += 1
+        return rows
+
+    @staticmethod
+    def __sortValue(job, column):
+        value = getattr(job, column)
+        if column in ("first_seen", "last_seen"):
+            return value or 0.0
+        return (value or "").lower()
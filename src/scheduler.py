@@ -0,0 +1,74 @@
+"""
+Runs many search profiles at once on one scraper.
+
+Every profile runs in its own thread, but they all share the scraper's fetcher, so the per-host rate limit is one
+global request budget for the whole batch instead of one per profile. Jobs that show up in several profiles get
+their detail page fetched only once. Events of all profiles are merged into one stream, and every Job, Progress
+and Finished event carries the name of its profile.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import queue
+from duunitori import Job
+
+# Marks the end of one profile's events in the queue
+_DONE = object()
+
+
+class Scheduler:
+    """
+    scraper -- duunitori.Scraper shared by all the profiles
+    parallel -- number of profiles scraped at the same time
+    """
+
+    def __init__(self, scraper, parallel=4):
+        self.scraper = scraper
+        self.parallel = parallel
+
+    def cancel(self):
+        self.scraper.cancel()
+
+    def events(self, profiles):
+        """
+        Scrapes all profiles, yielding their events as they come.
+        Exceptions raised while scraping a profile are yielded as events too, the other profiles keep going.
+        """
+        profiles = list(profiles)
+        if not profiles:
+            return
+        self.scraper.reset()
+        events = queue.Queue()
+        running = len(profiles)
+        pool = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="profile")
+        try:
+            for profile in profiles:
+                pool.submit(self.__run, profile, events)
+
+            while running:
+                event = events.get()
+                if event is _DONE:
+                    running -= 1
+                else:
+                    yield event
+        finally:
+            # Consumer stopped early, stop the rest of the profiles too
+            if running:
+                self.scraper.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def __run(self, profile, events):
+        try:
+            if self.scraper.cancelled():
+                return
+            for event in self.scraper.events(profile):
+                events.put(event)
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(_DONE)
+
+    def jobs(self, profiles):
+        """
+        Just the jobs of all the profiles, without the other events
+        """
+        return (event for event in self.events(profiles) if isinstance(event, Job))
@@ -0,0 +1,188 @@
+"""
+Persistent store of job listings seen in earlier runs, stored in SQLite.
+
+Jobs are keyed by their link and keep the data extracted from the detail page, so a listing seen before
+doesn't need its detail page fetched again. Every search profile has its own sightings with first-seen and
+last-seen timestamps, and listings that drop out of a profile's results get marked as removed.
+
+The history table logs what happened to the listings of every profile:
+new -- first sighting of a listing
+reposted -- first sighting of a listing with the same VatID and title as an earlier one, detail is the earlier link
+reappeared -- a listing marked as removed showed up again
+changed -- the detail page of a listing changed, detail has the changed fields as JSON {field: [old, new]}
+vanished -- a listing dropped out of the results
+"""
+
+from threading import Lock
+import json
+import re
+import time
+from database import openDatabase
+
+FIELDS = ("title", "location", "employer", "vatid", "field")
+
+_word = re.compile(r"\w+")
+
+
+def dedupeKey(job):
+    """
+    Key telling apart reposts of the same ad: the employer's VatID and the title in lower case without punctuation.
+    None if the job has no VatID.
+    """
+    vatid = (job.get("vatid") or "").strip()
+    if not vatid or vatid == "-":
+        return None
+    return vatid + " " + " ".join(_word.findall((job.get("title") or "").lower()))
+
+
+class SeenStore:
+    """
+    path -- SQLite database file, see openDatabase
+    """
+
+    def __init__(self, path):
+        self.__lock = Lock()
+        self.__db = openDatabase(path)
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                 link TEXT PRIMARY KEY,
+                                 title TEXT, location TEXT, employer TEXT, vatid TEXT, field TEXT,
+                                 first_seen REAL NOT NULL,
+                                 last_seen REAL NOT NULL,
+                                 updated REAL,
+                                 key TEXT)""")
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS sightings (
+                                 profile TEXT NOT NULL,
+                                 link TEXT NOT NULL,
+                                 first_seen REAL NOT NULL,
+                                 last_seen REAL NOT NULL,
+                                 removed INTEGER NOT NULL DEFAULT 0,
+                                 PRIMARY KEY (profile, link))""")
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS history (
+                                 time REAL NOT NULL,
+                                 profile TEXT NOT NULL,
+                                 link TEXT NOT NULL,
+                                 event TEXT NOT NULL,
+                                 detail TEXT)""")
+        self.__migrate()
+        self.__db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS history_profile ON history (profile, time)")
+        self.__db.commit()
+
+    def __migrate(self):
+        """
+        Adds the columns missing from stores made by older versions
+        """
+        columns = {row[1] for row in self.__db.execute("PRAGMA table_info(jobs)")}
+        if "updated" not in columns:
+            self.__db.execute("ALTER TABLE jobs ADD COLUMN updated REAL")
+            self.__db.execute("UPDATE jobs SET updated = first_seen")
+        if "key" not in columns:
+            self.__db.execute("ALTER TABLE jobs ADD COLUMN key TEXT")
+            rows = self.__db.execute("SELECT link, title, vatid FROM jobs").fetchall()
+            self.__db.executemany("UPDATE jobs SET key = ? WHERE link = ?",
+                                  [(dedupeKey({"title": title, "vatid": vatid}), link) for link, title, vatid in rows])
+
+    def lookup(self, link):
+        """
+        Returns the stored job as a dictionary, or None if the link hasn't been seen.
+        updated is the time its detail page was last fetched.
+        """
+        with self.__lock:
+            row = self.__db.execute("SELECT title, location, employer, vatid, field, first_seen, last_seen, updated "
+                                    "FROM jobs WHERE link = ?", (link,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(FIELDS, row))
+        job["link"] = link
+        job["first_seen"], job["last_seen"], job["updated"] = row[-3:]
+        return job
+
+    def record(self, profile, link, job=None, now=None):
+        """
+        Marks link as seen in profile. job is the extracted data of a newly fetched detail page,
+        it replaces what was stored before.
+        Returns what happened to the listing in profile: "new", "reposted", "reappeared" or "changed",
+        None if nothing did. The event is logged in the history too.
+        """
+        now = now or time.time()
+        event = detail = None
+        with self.__lock:
+            if job is not None:
+                old = self.__db.execute("SELECT title, location, employer, vatid, field FROM jobs WHERE link = ?",
+                                        (link,)).fetchone()
+                if old is not None:
+                    changes = {field: [value, job[field]] for field, value in zip(FIELDS, old)
+                               if value != job[field]}
+                    if changes:
+                        event, detail = "changed", json.dumps(changes, ensure_ascii=False)
+                self.__db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                                  "ON CONFLICT (link) DO UPDATE SET title = excluded.title, "
+                                  "location = excluded.location, employer = excluded.employer, "
+                                  "vatid = excluded.vatid, field = excluded.field, last_seen = excluded.last_seen, "
+                                  "updated = excluded.updated, key = excluded.key",
+                                  (link, *(job[key] for key in FIELDS), now, now, now, dedupeKey(job)))
+            else:
+                self.__db.execute("UPDATE jobs SET last_seen = ? WHERE link = ?", (now, link))
+
+            sighting = self.__db.execute("SELECT removed FROM sightings WHERE profile = ? AND link = ?",
+                                         (profile, link)).fetchone()
+            if sighting is None:
+                # An earlier listing with the same VatID and title makes this one a repost
+                original = self.__db.execute("SELECT other.link FROM jobs AS this JOIN jobs AS other "
+                                             "ON other.key = this.key AND other.link != this.link "
+                                             "AND other.first_seen <= this.first_seen "
+                                             "WHERE this.link = ? LIMIT 1", (link,)).fetchone()
+                event, detail = ("reposted", original[0]) if original is not None else ("new", None)
+            elif sighting[0]:
+                event, detail = "reappeared", None
+            self.__db.execute("INSERT INTO sightings (profile, link, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                              "ON CONFLICT (profile, link) DO UPDATE SET last_seen = excluded.last_seen, removed = 0",
+                              (profile, link, now, now))
+            if event is not None:
+                self.__db.execute("INSERT INTO history VALUES (?, ?, ?, ?, ?)", (now, profile, link, event, detail))
+            self.__db.commit()
+        return event
+
+    def markRemoved(self, profile, since):
+        """
+        Marks listings of profile not seen since the given timestamp as removed.
+        Only call after a complete run, otherwise listings on unvisited pages get marked too.
+        Returns the number of newly removed listings.
+        """
+        now = time.time()
+        with self.__lock:
+            links = self.__db.execute("SELECT link FROM sightings WHERE profile = ? AND last_seen < ? AND removed = 0",
+                                      (profile, since)).fetchall()
+            self.__db.execute("UPDATE sightings SET removed = 1 "
+                              "WHERE profile = ? AND last_seen < ? AND removed = 0", (profile, since))
+            self.__db.executemany("INSERT INTO history VALUES (?, ?, ?, 'vanished', NULL)",
+                                  [(now, profile, link) for link, in links])
+            self.__db.commit()
+        return len(links)
+
+    def removed(self, profile):
+        """
+        Returns the links of profile that have dropped out of the results
+        """
+        with self.__lock:
+            rows = self.__db.execute("SELECT link FROM sightings WHERE profile = ? AND removed = 1",
+                                     (profile,)).fetchall()
+        return [row[0] for row in rows]
+
+    def history(self, profile=None, since=None):
+        """
+        Returns the logged events, oldest first, as dictionaries with time, profile, link, event and detail.
+        Can be limited to one profile and to events after a timestamp, eg. the start of the previous run.
+        """
+        query = "SELECT time, profile, link, event, detail FROM history WHERE time >= ?"
+        args = [since or 0]
+        if profile is not None:
+            query += " AND profile = ?"
+            args.append(profile)
+        with self.__lock:
+            rows = self.__db.execute(query + " ORDER BY time, rowid", args).fetchall()
+        return [dict(zip(("time", "profile", "link", "event", "detail"), row)) for row in rows]
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
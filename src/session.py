@@ -0,0 +1,73 @@
+"""
+Shared HTTP session for all the scrapers.
+
+Keeps connections alive between requests, so long runs don't open a new TCP+TLS connection for every page.
+Transient errors (timeouts, connection drops, 429 and 5xx responses) are retried with exponential backoff,
+and Retry-After headers sent by the site are honored.
+"""
+
+from threading import Lock
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = "Scrapers Extravaganza"
+
+
+class HttpSession(requests.Session):
+    """
+    requests.Session with retrying, pooled adapters and a default timeout.
+    pool_size -- connections kept alive per host, should be at least the number of fetcher workers
+    retries -- number of retries for a single request
+    backoff -- backoff factor, retries wait backoff * 2 ** (retry - 1) seconds
+    timeout -- default (connect, read) timeout used when a request doesn't give its own
+    """
+
+    def __init__(self, pool_size=16, retries=4, backoff=0.5, timeout=(5, 20)):
+        super().__init__()
+        self.timeout = timeout
+        self.headers["User-Agent"] = USER_AGENT
+
+        self.__retry = Retry(total=retries,
+                             backoff_factor=backoff,
+                             status_forcelist=(429, 500, 502, 503, 504),
+                             allowed_methods=("GET", "HEAD"),
+                             respect_retry_after_header=True,
+                             raise_on_status=False,
+                             )
+        self.poolSize = 0
+        self.setPoolSize(pool_size)
+
+    def setPoolSize(self, pool_size):
+        """
+        Mounts new adapters keeping pool_size connections per host, the connections of the old ones are closed
+        """
+        old = self.adapters.get("http://")
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=self.__retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.poolSize = pool_size
+        if old is not None:
+            old.close()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_lock = Lock()
+
+
+def getSession(pool_size=None):
+    """
+    Returns the session shared by all the scraper tabs, created on first use.
+    pool_size -- connections per host the caller needs, eg. its worker count, a smaller pool is grown to it
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = HttpSession() if pool_size is None else HttpSession(pool_size=max(pool_size, 16))
+        elif pool_size is not None and pool_size > _session.poolSize:
+            _session.setPoolSize(pool_size)
+        return _session
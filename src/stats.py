@@ -0,0 +1,152 @@
+"""
+Lightweight instrumentation for the scraper's hot path.
+
+Counters and per-stage latency histograms, cheap enough to keep on all the time. The stages timed by the scraper:
+first_job -- time from the start of a profile's scrape to its first job
+listing_fetch, detail_fetch -- requests, split into rate_limit_wait and the request itself in the fetcher
+parse_listing, parse_detail -- HTML parsing
+ui_insert -- inserting a batch of jobs into the job list
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+import json
+import time
+
+# Histogram bucket upper bounds in seconds, from 0.1 ms doubling up to about 1.7 minutes
+BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+
+
+class Histogram:
+    """
+    Latency histogram with exponential buckets. Percentiles are estimated as the upper bound of their bucket.
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, share):
+        if not self.count:
+            return 0.0
+        target = share * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {"count": self.count,
+                "total_s": round(self.total, 6),
+                "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+                "p50_ms": round(self.percentile(0.5) * 1000, 3),
+                "p99_ms": round(self.percentile(0.99) * 1000, 3),
+                "max_ms": round((self.max or 0.0) * 1000, 3),
+                }
+
+
+class Stats:
+    """
+    Thread-safe collection of counters and stage histograms
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__counters = {}
+            self.__stages = {}
+            self.__started = time.time()
+
+    def count(self, name, n=1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + n
+
+    def observe(self, stage, seconds):
+        with self.__lock:
+            histogram = self.__stages.get(stage)
+            if histogram is None:
+                histogram = self.__stages[stage] = Histogram()
+            histogram.add(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        Everything recorded so far as a JSON serializable dictionary
+        """
+        with self.__lock:
+            return {"elapsed_s": round(time.time() - self.__started, 3),
+                    "counters": dict(self.__counters),
+                    "stages": {stage: histogram.summary() for stage, histogram in self.__stages.items()},
+                    }
+
+    def summary(self):
+        """
+        One line summary for a status bar
+        """
+        snapshot = self.snapshot()
+        counters = snapshot["counters"]
+        parts = ["%d requests" % counters.get("requests", 0),
+                 "%d cached" % counters.get("cache_hits", 0),
+                 "%d failed" % counters.get("failed", 0),
+                 "%d jobs" % counters.get("jobs", 0)]
+        for stage in ("detail_fetch", "parse_detail"):
+            if stage in snapshot["stages"]:
+                parts.append("%s p50 %.0f ms" % (stage.replace("_", " "), snapshot["stages"][stage]["p50_ms"]))
+        return ", ".join(parts)
+
+    def dump(self, file):
+        """
+        Writes the snapshot as JSON to a path or an open file
+        """
+        if hasattr(file, "write"):
+            json.dump(self.snapshot(), file, indent=2)
+            file.write("\n")
+        else:
+            with open(file, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, indent=2)
+
+
+@contextmanager
+def profiled(path=None):
+    """
+    Runs the block under cProfile. The stats are saved to path for pstats / snakeviz, or printed if path is None.
+    """
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
@@ -0,0 +1,355 @@
+"""
+Tori.fi deal watcher: polls saved searches on a schedule and flags new listings and price drops.
+
+Searches are read from Tori's JSON search api, newest listings first. Polls are kept cheap:
+- Search pages are always revalidated through the response cache, so an unchanged page costs a 304 and no body.
+- A first page identical to the one of the last poll isn't parsed at all.
+- Listing ids grow, so paging stops at the first page reaching the newest listing id of the last poll.
+That alone would only see price changes of the listings on that last page, so every rescan_every polls the first
+first_pages pages are read again in any case. Price drops on older listings further down aren't caught.
+Listings of every search are kept in SQLite with a short price history, and a poll yields only the listings it found
+new or with a changed price.
+"""
+
+from hashlib import blake2b
+from threading import Event, Lock
+from urllib.parse import urlencode
+import json
+import os
+import time
+from database import openDatabase
+from engine import SitePlugin, Progress, Finished
+
+BASE_URL = "https://www.tori.fi/"
+SEARCH_PATH = "recommerce-search-page/api/search/SEARCH_ID_BAP_COMMON"
+ITEM_URL = "%srecommerce/forsale/item/%d"
+
+SETTINGS = {"store": os.path.dirname(os.getcwd()) + "/cache/tori.sqlite",
+            # Seconds between polls of the same search
+            "interval": 5 * 60,
+            # Pages read on the first poll of a search and on rescans, other polls page only through the new listings
+            "first_pages": 3,
+            # Every this many polls of a search are rescans, the first poll after starting is one too
+            "rescan_every": 12,
+            # Prices kept per listing
+            "history": 10,
+            }
+
+
+def _price(doc):
+    price = doc.get("price")
+    if isinstance(price, dict):
+        price = price.get("amount")
+    try:
+        return float(price) if price is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ToriPlugin(SitePlugin):
+    """
+    One poll of a search, query is the search text.
+    since -- newest listing id of the last poll, paging stops at the page reaching it
+    unchanged -- digest of the first page at the last poll, the same page again gives no records
+    min_pages -- pages read before since can stop the paging, for rescanning the older listings
+    digest -- digest of the first page of this poll, after the crawl
+    """
+
+    name = "tori"
+    title = "Tori.fi"
+    columns = (("title", "Title"),
+               ("price", "Price €"),
+               ("previous_price", "Was €"),
+               ("event", "Change"),
+               ("location", "Location"),
+               ("posted", "Posted"),
+               ("search", "Search"),
+               ("link", "Link"),
+               )
+    query_label = "Search"
+    # Search pages are always revalidated, a 304 is all an unchanged page costs
+    ttl = 0
+    max_pages = 20
+    headers = {"Accept": "application/json"}
+    types = {"price": "float64", "previous_price": "float64"}
+
+    def __init__(self, base_url=BASE_URL, since=None, unchanged=None, min_pages=1):
+        self.base_url = base_url
+        self.since = since
+        self.unchanged = unchanged
+        self.minPages = min_pages
+        self.digest = None
+        self.__query = None
+        self.__first = None
+
+    def searchUrl(self, query, page=1):
+        return self.base_url + SEARCH_PATH + "?" + urlencode((("q", query or ""), ("sort", "PUBLISHED_DESC"),
+                                                              ("page", page)))
+
+    def startUrls(self, query):
+        self.__query = query
+        self.__first = self.searchUrl(query)
+        return [self.__first]
+
+    def parse(self, url, content):
+        if url == self.__first:
+            self.digest = blake2b(content, digest_size=16).hexdigest()
+            if self.digest == self.unchanged:
+                return [], []
+        result = json.loads(content)
+        records = []
+        for doc in result.get("docs", ()):
+            try:
+                listing_id = int(doc.get("id"))
+            except (TypeError, ValueError):
+                continue
+            posted = doc.get("timestamp")
+            if posted:
+                posted = time.strftime("%Y-%m-%d %H:%M", time.localtime(posted / 1000))
+            records.append({"id": listing_id,
+                            "title": doc.get("heading"),
+                            "price": _price(doc),
+                            "location": doc.get("location"),
+                            "posted": posted or None,
+                            "link": doc.get("canonical_url") or ITEM_URL % (self.base_url, listing_id),
+                            "search": self.__query,
+                            })
+        paging = (result.get("metadata") or {}).get("paging") or {}
+        page = paging.get("current", 1)
+        if not records or page >= paging.get("last", page):
+            return records, []
+        # Newest first, so a page reaching the last poll's newest listing is the last one with anything new
+        if self.since is not None and page >= self.minPages and min(record["id"] for record in records) <= self.since:
+            return records, []
+        return records, [self.searchUrl(self.__query, page + 1)]
+
+    def key(self, record):
+        return record["id"]
+
+
+class Polled:
+    """
+    Sent after each poll of a search.
+    new -- new listings, drops -- listings whose price dropped, unchanged -- first page was the same as last time
+    failed -- pages whose request failed, their listings get picked up by the next poll
+    error -- exception that ended the poll early, eg. an error page instead of JSON, None if there was none
+    """
+
+    __slots__ = ("search", "new", "drops", "unchanged", "failed", "error")
+
+    def __init__(self, search, new, drops, unchanged, failed=0, error=None):
+        self.search = search
+        self.new = new
+        self.drops = drops
+        self.unchanged = unchanged
+        self.failed = failed
+        self.error = error
+
+
+class WatchStore:
+    """
+    Saved searches, their listings and the price history of the listings, in SQLite.
+    path -- SQLite database file, see openDatabase
+    history -- prices kept per listing
+    """
+
+    def __init__(self, path, history=10):
+        self.history = history
+        self.__lock = Lock()
+        self.__db = openDatabase(path)
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS searches (
+                                 search TEXT PRIMARY KEY,
+                                 last_id INTEGER,
+                                 digest TEXT,
+                                 last_poll REAL)""")
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS listings (
+                                 id INTEGER PRIMARY KEY,
+                                 search TEXT NOT NULL,
+                                 title TEXT, price REAL, location TEXT, posted TEXT, link TEXT,
+                                 first_seen REAL NOT NULL,
+                                 last_seen REAL NOT NULL)""")
+        self.__db.execute("""CREATE TABLE IF NOT EXISTS prices (
+                                 id INTEGER NOT NULL,
+                                 time REAL NOT NULL,
+                                 price REAL)""")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS prices_id ON prices (id, time)")
+        self.__db.commit()
+
+    def addSearch(self, search):
+        with self.__lock:
+            self.__db.execute("INSERT OR IGNORE INTO searches (search) VALUES (?)", (search,))
+            self.__db.commit()
+
+    def removeSearch(self, search):
+        with self.__lock:
+            self.__db.execute("DELETE FROM searches WHERE search = ?", (search,))
+            self.__db.commit()
+
+    def searches(self):
+        """
+        Returns (search, last_poll) pairs of the saved searches
+        """
+        with self.__lock:
+            return self.__db.execute("SELECT search, last_poll FROM searches ORDER BY search").fetchall()
+
+    def state(self, search):
+        """
+        Returns (last_id, digest) of the search's last poll
+        """
+        with self.__lock:
+            row = self.__db.execute("SELECT last_id, digest FROM searches WHERE search = ?", (search,)).fetchone()
+        return row or (None, None)
+
+    def update(self, search, records, digest=None, completed=True):
+        """
+        Stores the listings of a poll. Returns the new listings and the ones whose price changed, with "event" set to
+        new, drop or raise and "previous_price" to the price before. The last listing id is moved on only by
+        completed polls, so a cancelled one gets paged through again next time.
+        """
+        now = time.time()
+        changes = []
+        with self.__lock:
+            known = {}
+            ids = [record["id"] for record in records]
+            # SQLite takes 999 parameters at most
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                known.update(self.__db.execute("SELECT id, price FROM listings WHERE id IN (%s)"
+                                               % ",".join("?" * len(chunk)), chunk))
+            seen = []
+            for record in records:
+                listing_id = record["id"]
+                price = record["price"]
+                if listing_id not in known:
+                    self.__db.execute("INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                      (listing_id, search, record["title"], price, record["location"],
+                                       record["posted"], record["link"], now, now))
+                    self.__db.execute("INSERT INTO prices VALUES (?, ?, ?)", (listing_id, now, price))
+                    changes.append(dict(record, event="new", previous_price=None))
+                elif price is not None and known[listing_id] is not None and price != known[listing_id]:
+                    self.__db.execute("UPDATE listings SET price = ?, title = ?, last_seen = ? WHERE id = ?",
+                                      (price, record["title"], now, listing_id))
+                    self.__db.execute("INSERT INTO prices VALUES (?, ?, ?)", (listing_id, now, price))
+                    self.__db.execute("DELETE FROM prices WHERE id = ? AND time NOT IN "
+                                      "(SELECT time FROM prices WHERE id = ? ORDER BY time DESC LIMIT ?)",
+                                      (listing_id, listing_id, self.history))
+                    changes.append(dict(record, event="drop" if price < known[listing_id] else "raise",
+                                        previous_price=known[listing_id]))
+                else:
+                    seen.append((now, listing_id))
+            self.__db.executemany("UPDATE listings SET last_seen = ? WHERE id = ?", seen)
+            if completed and ids:
+                self.__db.execute("UPDATE searches SET last_id = MAX(COALESCE(last_id, 0), ?) WHERE search = ?",
+                                  (max(ids), search))
+            self.__db.execute("UPDATE searches SET last_poll = ?, digest = COALESCE(?, digest) WHERE search = ?",
+                              (now, digest if completed else None, search))
+            self.__db.commit()
+        return changes
+
+    def priceHistory(self, listing_id):
+        """
+        Returns the (time, price) pairs kept for a listing, oldest first
+        """
+        with self.__lock:
+            return self.__db.execute("SELECT time, price FROM prices WHERE id = ? ORDER BY time",
+                                     (listing_id,)).fetchall()
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+
+class Watcher:
+    """
+    Polls the saved searches of a WatchStore on the engine, each one every interval seconds.
+    engine -- engine.Engine the polls run on, shared with the other sites
+    first_pages, rescan_every -- see SETTINGS
+    """
+
+    def __init__(self, engine, store, base_url=BASE_URL, interval=None, first_pages=None, rescan_every=None):
+        self.engine = engine
+        self.store = store
+        self.base_url = base_url
+        self.interval = SETTINGS["interval"] if interval is None else interval
+        self.firstPages = first_pages or SETTINGS["first_pages"]
+        self.rescanEvery = rescan_every or SETTINGS["rescan_every"]
+        # Polls of every search since this watcher started
+        self.__polls = {}
+        self.__stop = Event()
+        self.__crawl = None
+
+    @classmethod
+    def fromSettings(cls, engine, settings=None):
+        settings = dict(SETTINGS, **(settings or {}))
+        return cls(engine, WatchStore(settings["store"], settings["history"]), interval=settings["interval"],
+                   first_pages=settings["first_pages"], rescan_every=settings["rescan_every"])
+
+    def cancel(self):
+        self.__stop.set()
+        crawl = self.__crawl
+        if crawl is not None:
+            crawl.cancel()
+
+    def cancelled(self):
+        return self.__stop.is_set()
+
+    def poll(self, search):
+        """
+        Polls one search. Yields the new and changed listings, Progress events and Polled at the end.
+        An error ending the poll is passed in Polled, so one broken search doesn't stop the others.
+        """
+        since, digest = self.store.state(search)
+        polls = self.__polls.get(search, 0)
+        self.__polls[search] = polls + 1
+        if since is not None and polls % self.rescanEvery == 0:
+            # Rescans page through the first pages even if nothing's new, an unchanged first page included
+            plugin = ToriPlugin(self.base_url, since, None, self.firstPages)
+        else:
+            plugin = ToriPlugin(self.base_url, since, digest)
+        # Without a last id there is nothing to stop the paging, so the first poll only reads the newest pages
+        crawl = self.__crawl = self.engine.crawl(plugin, search, None if since is not None else self.firstPages)
+        records = []
+        completed = False
+        error = None
+        try:
+            for event in crawl.events():
+                if isinstance(event, dict):
+                    records.append(event)
+                elif isinstance(event, Progress):
+                    yield event
+                elif isinstance(event, Finished):
+                    # A failed page may have had new listings, so only a fully fetched poll moves the last id on
+                    completed = event.completed and not crawl.failed
+        except Exception as e:
+            error = e
+        self.__crawl = None
+        changes = self.store.update(search, records, plugin.digest, completed)
+        new = drops = 0
+        for change in changes:
+            new += change["event"] == "new"
+            drops += change["event"] == "drop"
+            yield change
+        yield Polled(search, new, drops, digest is not None and plugin.digest == digest, crawl.failed, error)
+
+    def events(self):
+        """
+        Polls the searches that are due until cancelled, sleeping in between
+        """
+        self.__stop.clear()
+        while not self.cancelled():
+            now = time.time()
+            wait = self.interval
+            for search, last_poll in self.store.searches():
+                due = (last_poll or 0) + self.interval
+                if due <= now:
+                    yield from self.poll(search)
+                    if self.cancelled():
+                        break
+                else:
+                    wait = min(wait, due - now)
+            # Searches added while watching get picked up within half a minute
+            self.__stop.wait(min(max(wait, 1), 30))
+        yield Finished(False, ToriPlugin.name)
+
+    def close(self):
+        self.store.close()